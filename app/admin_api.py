@@ -1,11 +1,15 @@
 # app/admin_api.py
 # Admin API endpoints for product management
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
+import hmac
 import logging
 import os
+import orjson
 
 from app.admin_models import (
     AmazonProductRequest,
@@ -14,20 +18,27 @@ from app.admin_models import (
     AICategorizationResponse,
     GiftProduct,
     ProductSaveRequest,
+    ProductBulkSaveRequest,
+    ProductUpdate,
     ProductListResponse,
     QualityCheckResponse
 )
 from app.amazon_scraper import scrape_amazon_product, get_quality_indicators
-from app.ai_categorization import categorize_product
+from app.ai_categorization import categorize_product, validate_categorization
 from app.admin_products import (
     save_product,
+    save_products_bulk,
     get_product,
+    get_product_quality_fields,
     list_products,
+    iter_products,
     update_product,
     delete_product,
-    get_product_stats
+    get_product_stats,
+    invalidate_product_cache
 )
 from app.database import get_db
+from app.cache import cache_status
 from app.llm import generate_display_name
 from app.embeddings import generate_embedding, create_gift_text_for_embedding
 from supabase import Client
@@ -36,17 +47,22 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+# Max URLs scraped/categorized at once by /api/ingest/bulk (caps outbound
+# concurrency to Amazon and OpenAI)
+INGEST_CONCURRENCY = 8
+
 # Admin authentication
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", os.getenv("BACKEND_API_KEY"))
+_ADMIN_KEY_BYTES = ADMIN_API_KEY.encode() if ADMIN_API_KEY else None
 
 
 def verify_admin(x_api_key: Optional[str] = Header(None)):
-    """Verify admin API key."""
-    if not ADMIN_API_KEY:
+    """Verify admin API key (constant-time comparison)."""
+    if _ADMIN_KEY_BYTES is None:
         logger.warning("No ADMIN_API_KEY set - admin endpoints are unprotected!")
         return
 
-    if not x_api_key or x_api_key != ADMIN_API_KEY:
+    if not x_api_key or not hmac.compare_digest(x_api_key.encode(), _ADMIN_KEY_BYTES):
         raise HTTPException(status_code=401, detail="Unauthorized - Invalid API key")
 
 
@@ -63,6 +79,16 @@ class ShippingUpdate(BaseModel):
     shipping_notes: Optional[str] = None
 
 
+class IngestRequest(BaseModel):
+    url: str
+    created_by: Optional[str] = "admin"
+
+
+class BulkIngestRequest(BaseModel):
+    urls: List[str]
+    created_by: Optional[str] = "admin"
+
+
 class ManualProductRequest(BaseModel):
     """Request body for manually entered products (no Amazon scrape needed)."""
     name: str
@@ -105,31 +131,27 @@ async def fetch_amazon_product_endpoint(
         if not product_data:
             raise HTTPException(status_code=404, detail="Product details could not be scraped")
 
-        # Generate clean display name via LLM
-        display_name = generate_display_name(
-            product_name=product_data.get('name', ''),
-            description=product_data.get('description', '')
-        )
-
-        logger.info("✨ Display Name Generated: %s" % display_name)
-
-        # Prepare for search: Generate Embeddings
+        # Display name (LLM) and embedding are sync calls; run them off the
+        # event loop, in parallel
         gift_temp = {
             "name": product_data.get('name'),
             "description": product_data.get('description', ''),
             "categories": []
         }
         embedding_text = create_gift_text_for_embedding(gift_temp)
-        embedding = generate_embedding(embedding_text)
+        display_name, embedding = await asyncio.gather(
+            asyncio.to_thread(
+                generate_display_name,
+                product_name=product_data.get('name', ''),
+                description=product_data.get('description', '')
+            ),
+            asyncio.to_thread(generate_embedding, embedding_text),
+        )
 
-        # Generate a sequential gift ID (table has no auto-increment default)
-        from app.admin_products import get_next_gift_id
-        gift_id = get_next_gift_id()
-        logger.info("Generated gift ID: %s" % gift_id)
+        logger.info("✨ Display Name Generated: %s" % display_name)
 
-        # Save to Supabase
-        result = db.table('gifts').insert({
-            'id': gift_id,
+        # Save to Supabase (ID is assigned by the gift_id_seq column default)
+        result = await asyncio.to_thread(db.table('gifts').insert({
             'name': product_data.get('name'),
             'display_name': display_name,
             'price': product_data.get('price', 0.0),
@@ -141,11 +163,13 @@ async def fetch_amazon_product_endpoint(
             'shipping_max_days': 8,
             'is_prime_eligible': product_data.get('is_prime_eligible', False),
             'embedding': embedding
-        }).execute()
+        }).execute)
 
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to insert product into database")
 
+        invalidate_product_cache()
+
         return {
             "success": True,
             "product": result.data[0],
@@ -158,12 +182,112 @@ async def fetch_amazon_product_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _ingest_amazon_url(url: str, db: Client, created_by: str) -> dict:
+    """
+    Scrape an Amazon URL, then categorize it, name it and embed it
+    concurrently, and save the fully tagged product. Returns the saved row.
+    """
+    product_data = await scrape_amazon_product(url)
+    name = product_data.get('name', '')
+    description = product_data.get('description', '')
+
+    embedding_text = create_gift_text_for_embedding({
+        "name": name,
+        "description": description,
+        "categories": []
+    })
+
+    # All three only depend on the scrape, so run them side by side
+    categorization, display_name, embedding = await asyncio.gather(
+        categorize_product(name, description, product_data.get('brand') or ""),
+        asyncio.to_thread(generate_display_name, product_name=name, description=description),
+        asyncio.to_thread(generate_embedding, embedding_text),
+    )
+    # Raw LLM tags are unchecked; keep only vocabulary values within the
+    # GiftProduct limits so the saved row reads back as a valid GiftProduct
+    tags = validate_categorization(categorization.model_dump())
+
+    record = {
+        'name': name,
+        'display_name': display_name,
+        'price': product_data.get('price', 0.0),
+        'description': description,
+        'brand': product_data.get('brand'),
+        'image_url': product_data.get('image_url'),
+        'link': product_data.get('product_url') or product_data.get('link'),
+        'source': 'amazon',
+        'rating': product_data.get('rating'),
+        'review_count': product_data.get('review_count'),
+        'categories': tags['categories'],
+        'interests': tags['interests'],
+        'occasions': tags['occasions'],
+        'vibe': tags['vibe'],
+        'personality_traits': tags['personality_traits'],
+        'recipient': tags['recipient'],
+        'experience_level': tags['experience_level'],
+        'shipping_min_days': 5,
+        'shipping_max_days': 8,
+        'is_prime_eligible': product_data.get('is_prime_eligible', False),
+        'embedding': embedding,
+        'created_by': created_by,
+    }
+
+    result = await asyncio.to_thread(db.table('gifts').insert(record).execute)
+    if not result.data:
+        raise ValueError("Failed to insert product into database")
+    return result.data[0]
+
+
+@router.post("/api/ingest")
+async def ingest_product_endpoint(
+        request: IngestRequest,
+        db: Client = Depends(get_db),
+        _: None = Depends(verify_admin)
+):
+    """Scrape, categorize, name, embed and save an Amazon product in one call."""
+    try:
+        saved = await _ingest_amazon_url(request.url, db, request.created_by or "admin")
+        invalidate_product_cache()
+        return {"success": True, "id": saved.get('id'), "product": saved}
+    except Exception as e:
+        logger.error("Error in ingest: %s" % str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/ingest/bulk")
+async def ingest_products_bulk_endpoint(
+        request: BulkIngestRequest,
+        db: Client = Depends(get_db),
+        _: None = Depends(verify_admin)
+):
+    """Ingest many Amazon URLs concurrently (at most INGEST_CONCURRENCY at once)."""
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    created_by = request.created_by or "admin"
+
+    async def ingest(url: str) -> dict:
+        async with semaphore:
+            try:
+                saved = await _ingest_amazon_url(url, db, created_by)
+                return {"url": url, "success": True, "id": saved.get('id')}
+            except Exception as e:
+                logger.error("Error ingesting %s: %s" % (url, str(e)))
+                return {"url": url, "success": False, "error": str(e)}
+
+    results = await asyncio.gather(*[ingest(url) for url in request.urls])
+
+    succeeded = sum(1 for r in results if r["success"])
+    if succeeded:
+        invalidate_product_cache()
+
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
 # ============================================
 # Manual Product Creation (NEW)
 # ============================================
 
 @router.post("/api/products/manual")
-async def create_manual_product_endpoint(
+def create_manual_product_endpoint(
         request: ManualProductRequest,
         db: Client = Depends(get_db),
         _: None = Depends(verify_admin)
@@ -172,6 +296,7 @@ async def create_manual_product_endpoint(
     Create a product manually without Amazon scraping.
     Generates a display name (if not provided) and embeddings,
     then saves to the database with the full tag schema.
+    Every call here is sync, so this is a plain `def` (threadpool).
     """
     try:
         logger.info("Creating manual product: %s" % request.name)
@@ -194,14 +319,9 @@ async def create_manual_product_endpoint(
         embedding_text = create_gift_text_for_embedding(gift_temp)
         embedding = generate_embedding(embedding_text)
 
-        # Generate a sequential gift ID (table has no auto-increment default)
-        from app.admin_products import get_next_gift_id
-        gift_id = get_next_gift_id()
-        logger.info("Generated gift ID: %s" % gift_id)
-
-        # Build the full record — matching the current gifts table schema
+        # Build the full record — matching the current gifts table schema.
+        # The ID is assigned by the gift_id_seq column default.
         record = {
-            'id': gift_id,
             'name': request.name,
             'display_name': display_name,
             'description': request.description,
@@ -232,6 +352,7 @@ async def create_manual_product_endpoint(
 
         saved = result.data[0]
         logger.info("Manual product saved: %s (%s)" % (saved.get('id'), request.name))
+        invalidate_product_cache()
 
         return {
             "success": True,
@@ -248,6 +369,7 @@ async def create_manual_product_endpoint(
 @router.post("/api/categorize", response_model=AICategorizationResponse)
 async def categorize_product_endpoint(
         request: AICategorizationRequest,
+        response: Response,
         _: None = Depends(verify_admin)
 ):
     """Use AI to suggest product categorization."""
@@ -257,6 +379,7 @@ async def categorize_product_endpoint(
             description=request.description or "",
             brand=request.brand or ""
         )
+        response.headers["X-Cache"] = cache_status.get()
         return categorization
     except Exception as e:
         raise HTTPException(status_code=500, detail="Categorization failed: %s" % str(e))
@@ -265,9 +388,11 @@ async def categorize_product_endpoint(
 # ============================================
 # Product CRUD & Management
 # ============================================
+# Endpoints below call the sync Supabase client, so they are plain `def`
+# and run on Starlette's threadpool instead of blocking the event loop.
 
-@router.get("/api/products", response_model=ProductListResponse)
-async def list_products_endpoint(
+@router.get("/api/products", response_model=ProductListResponse, response_class=ORJSONResponse)
+def list_products_endpoint(
         page: int = 1,
         page_size: int = 20,
         sort_by: str = "created_at",
@@ -282,7 +407,7 @@ async def list_products_endpoint(
 
 
 @router.post("/api/products")
-async def create_product_endpoint(request: ProductSaveRequest, _: None = Depends(verify_admin)):
+def create_product_endpoint(request: ProductSaveRequest, _: None = Depends(verify_admin)):
     """
     Save a product built from the admin form (post-scrape or post-manual).
     Routes to the manual creation path which handles embeddings + display name.
@@ -316,24 +441,64 @@ async def create_product_endpoint(request: ProductSaveRequest, _: None = Depends
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/api/products/{product_id}", response_model=GiftProduct)
-async def get_product_endpoint(product_id: str, _: None = Depends(verify_admin)):
+@router.post("/api/products/bulk")
+def create_products_bulk_endpoint(request: ProductBulkSaveRequest, _: None = Depends(verify_admin)):
+    """Save a batch of products (e.g. catalog seeding) in one insert."""
+    try:
+        saved = save_products_bulk(request.products, request.created_by or "admin")
+        return {"ids": [p.id for p in saved], "count": len(saved), "status": "success"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/products/export")
+def export_products_endpoint(
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        in_stock_only: bool = False,
+        _: None = Depends(verify_admin)
+):
+    """Stream every matching product as NDJSON (one product per line)."""
+    rows = iter_products(search=search, category=category, in_stock_only=in_stock_only)
+    return StreamingResponse(
+        (orjson.dumps(row, default=str, option=orjson.OPT_APPEND_NEWLINE) for row in rows),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=products.ndjson"},
+    )
+
+
+@router.get("/api/products/{product_id}", response_model=GiftProduct, response_class=ORJSONResponse)
+def get_product_endpoint(product_id: str, _: None = Depends(verify_admin)):
     product = get_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 
+@router.get("/api/products/{product_id}/quality")
+def check_product_quality(product_id: str, _: None = Depends(verify_admin)):
+    """Quality indicators for a saved product, from a targeted select."""
+    fields = get_product_quality_fields(product_id)
+    if fields is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    rating, review_count, in_stock = fields
+    return get_quality_indicators(rating, review_count, in_stock)
+
+
+@router.patch("/api/products/{product_id}")
 @router.put("/api/products/{product_id}")
-async def update_product_endpoint(product_id: str, product: GiftProduct, _: None = Depends(verify_admin)):
-    updates = {k: v for k, v in product.dict().items() if v is not None and k != "id"}
+def update_product_endpoint(product_id: str, update: ProductUpdate, _: None = Depends(verify_admin)):
+    """Partially update a product with only the fields present in the body."""
+    updates = update.model_dump(exclude_unset=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="No fields to update")
     if not update_product(product_id, updates):
         raise HTTPException(status_code=404, detail="Product not found")
     return {"status": "success"}
 
 
 @router.delete("/api/products/{product_id}")
-async def delete_product_endpoint(product_id: str, _: None = Depends(verify_admin)):
+def delete_product_endpoint(product_id: str, _: None = Depends(verify_admin)):
     if not delete_product(product_id):
         raise HTTPException(status_code=404, detail="Product not found")
     return {"status": "success"}
@@ -344,7 +509,7 @@ async def delete_product_endpoint(product_id: str, _: None = Depends(verify_admi
 # ============================================
 
 @router.put("/api/products/{product_id}/display-name")
-async def update_display_name_endpoint(
+def update_display_name_endpoint(
         product_id: str,
         request: DisplayNameUpdate,
         db: Client = Depends(get_db),
@@ -357,11 +522,12 @@ async def update_display_name_endpoint(
 
     if not result.data:
         raise HTTPException(status_code=404, detail="Product not found")
+    invalidate_product_cache(product_id)
     return {"success": True, "display_name": request.display_name}
 
 
 @router.post("/api/products/{product_id}/regenerate-display-name")
-async def regenerate_display_name_endpoint(
+def regenerate_display_name_endpoint(
         product_id: str,
         db: Client = Depends(get_db),
         _: None = Depends(verify_admin)
@@ -375,6 +541,7 @@ async def regenerate_display_name_endpoint(
     new_name = generate_display_name(product['name'], product.get('description', ''))
 
     db.table('gifts').update({'display_name': new_name}).eq('id', product_id).execute()
+    invalidate_product_cache(product_id)
     return {"success": True, "display_name": new_name}
 
 
@@ -383,7 +550,7 @@ async def regenerate_display_name_endpoint(
 # ============================================
 
 @router.patch("/gifts/{gift_id}/shipping")
-async def update_gift_shipping(gift_id: str, update: ShippingUpdate, db: Client = Depends(get_db),
+def update_gift_shipping(gift_id: str, update: ShippingUpdate, db: Client = Depends(get_db),
                                _: None = Depends(verify_admin)):
     result = db.table('gifts').update({
         'shipping_min_days': update.shipping_min_days,
@@ -393,9 +560,10 @@ async def update_gift_shipping(gift_id: str, update: ShippingUpdate, db: Client
     }).eq('id', gift_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Gift not found")
+    invalidate_product_cache(gift_id)
     return {"status": "updated"}
 
 
-@router.get("/api/stats")
-async def get_stats(_: None = Depends(verify_admin)):
+@router.get("/api/stats", response_class=ORJSONResponse)
+def get_stats(_: None = Depends(verify_admin)):
     return get_product_stats()
\ No newline at end of file
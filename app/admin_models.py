@@ -1,33 +1,58 @@
 # app/admin_models.py
 # Pydantic models for admin product management
 
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal, get_args
 from datetime import datetime
 from decimal import Decimal
 
 
+Category = Literal["tech", "home", "kitchen", "fashion", "beauty", "fitness", "outdoors", "hobby", "book", "experiences"]
+Interest = Literal["coffee", "cooking", "baking", "fitness", "running", "yoga", "gaming", "photography", "music", "travel", "reading", "art", "gardening", "cycling", "hiking", "camping", "movies", "wine", "cocktails", "tea", "fashion", "skincare", "makeup"]
+Occasion = Literal["birthday", "anniversary", "valentines", "holiday", "christmas", "wedding", "engagement", "graduation", "just_because"]
+Vibe = Literal["romantic", "practical", "luxury", "fun", "sentimental", "creative", "cozy", "adventurous", "minimalist"]
+PersonalityTrait = Literal["introverted", "extroverted", "analytical", "creative", "sentimental", "adventurous", "organized", "relaxed", "curious"]
+ExperienceLevel = Literal["beginner", "enthusiast", "expert"]
+Gender = Literal["male", "female", "unisex"]
+Relationship = Literal["partner", "spouse", "boyfriend", "girlfriend", "friend", "family"]
+
+# Allowed values as frozensets for O(1) membership checks outside pydantic
+# (pydantic-core already validates the Literal fields with a hashed lookup)
+CATEGORIES: frozenset = frozenset(get_args(Category))
+INTERESTS: frozenset = frozenset(get_args(Interest))
+OCCASIONS: frozenset = frozenset(get_args(Occasion))
+VIBES: frozenset = frozenset(get_args(Vibe))
+PERSONALITY_TRAITS: frozenset = frozenset(get_args(PersonalityTrait))
+EXPERIENCE_LEVELS: frozenset = frozenset(get_args(ExperienceLevel))
+GENDERS: frozenset = frozenset(get_args(Gender))
+RELATIONSHIPS: frozenset = frozenset(get_args(Relationship))
+
+# Decoder for the smallint categories_ids column: id N is CATEGORIES_BY_ID[N - 1].
+# Order must match the vocab array in supabase_products_schema.sql (append-only).
+CATEGORIES_BY_ID: tuple = get_args(Category)
+
+
 class RecipientInfo(BaseModel):
-    gender: List[Literal["male", "female", "unisex"]] = []
-    relationship: List[Literal["partner", "spouse", "boyfriend", "girlfriend", "friend", "family"]] = []
+    gender: List[Gender] = []
+    relationship: List[Relationship] = []
 
 
 class GiftProduct(BaseModel):
     id: Optional[str] = None
     name: str
     description: Optional[str] = None
-    price: float
+    price: float = Field(ge=0)
     currency: str = "USD"
 
-    # Categorical arrays with max limits
-    categories: List[Literal["tech", "home", "kitchen", "fashion", "beauty", "fitness", "outdoors", "hobby", "book", "experiences"]] = Field(default_factory=list, max_items=2)
-    interests: List[Literal["coffee", "cooking", "baking", "fitness", "running", "yoga", "gaming", "photography", "music", "travel", "reading", "art", "gardening", "cycling", "hiking", "camping", "movies", "wine", "cocktails", "tea", "fashion", "skincare", "makeup"]] = Field(default_factory=list, max_items=5)
-    occasions: List[Literal["birthday", "anniversary", "valentines", "holiday", "christmas", "wedding", "engagement", "graduation", "just_because"]] = Field(default_factory=list, max_items=4)
-    vibe: List[Literal["romantic", "practical", "luxury", "fun", "sentimental", "creative", "cozy", "adventurous", "minimalist"]] = Field(default_factory=list, max_items=3)
-    personality_traits: List[Literal["introverted", "extroverted", "analytical", "creative", "sentimental", "adventurous", "organized", "relaxed", "curious"]] = Field(default_factory=list, max_items=3)
+    # Categorical arrays with max limits (enforced natively by pydantic-core)
+    categories: List[Category] = Field(default_factory=list, max_length=2)
+    interests: List[Interest] = Field(default_factory=list, max_length=5)
+    occasions: List[Occasion] = Field(default_factory=list, max_length=4)
+    vibe: List[Vibe] = Field(default_factory=list, max_length=3)
+    personality_traits: List[PersonalityTrait] = Field(default_factory=list, max_length=3)
 
     recipient: RecipientInfo = Field(default_factory=RecipientInfo)
-    experience_level: Optional[Literal["beginner", "enthusiast", "expert"]] = None
+    experience_level: Optional[ExperienceLevel] = None
 
     brand: Optional[str] = None
     link: Optional[str] = None
@@ -35,7 +60,7 @@ class GiftProduct(BaseModel):
     source: str = "amazon"
 
     # Quality metrics
-    rating: Optional[float] = None
+    rating: Optional[float] = Field(default=None, ge=0, le=5)
     review_count: Optional[int] = 0
     in_stock: bool = True
 
@@ -43,47 +68,31 @@ class GiftProduct(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
-    @validator('categories')
-    def validate_categories_limit(cls, v):
-        if len(v) > 2:
-            raise ValueError('categories cannot have more than 2 items')
-        return v
-
-    @validator('interests')
-    def validate_interests_limit(cls, v):
-        if len(v) > 5:
-            raise ValueError('interests cannot have more than 5 items')
-        return v
-
-    @validator('occasions')
-    def validate_occasions_limit(cls, v):
-        if len(v) > 4:
-            raise ValueError('occasions cannot have more than 4 items')
-        return v
-
-    @validator('vibe')
-    def validate_vibe_limit(cls, v):
-        if len(v) > 3:
-            raise ValueError('vibe cannot have more than 3 items')
-        return v
-
-    @validator('personality_traits')
-    def validate_personality_traits_limit(cls, v):
-        if len(v) > 3:
-            raise ValueError('personality_traits cannot have more than 3 items')
-        return v
-
-    @validator('rating')
-    def validate_rating(cls, v):
-        if v is not None and (v < 0 or v > 5):
-            raise ValueError('rating must be between 0 and 5')
-        return v
-
-    @validator('price')
-    def validate_price(cls, v):
-        if v < 0:
-            raise ValueError('price must be non-negative')
-        return v
+
+class ProductUpdate(BaseModel):
+    """Sparse update for a product; only fields the client sends are written."""
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = Field(default=None, ge=0)
+    currency: Optional[str] = None
+
+    categories: Optional[List[Category]] = Field(default=None, max_length=2)
+    interests: Optional[List[Interest]] = Field(default=None, max_length=5)
+    occasions: Optional[List[Occasion]] = Field(default=None, max_length=4)
+    vibe: Optional[List[Vibe]] = Field(default=None, max_length=3)
+    personality_traits: Optional[List[PersonalityTrait]] = Field(default=None, max_length=3)
+
+    recipient: Optional[RecipientInfo] = None
+    experience_level: Optional[ExperienceLevel] = None
+
+    brand: Optional[str] = None
+    link: Optional[str] = None
+    image_url: Optional[str] = None
+    source: Optional[str] = None
+
+    rating: Optional[float] = Field(default=None, ge=0, le=5)
+    review_count: Optional[int] = None
+    in_stock: Optional[bool] = None
 
 
 class AmazonProductRequest(BaseModel):
@@ -125,8 +134,24 @@ class ProductSaveRequest(BaseModel):
     created_by: Optional[str] = "admin"
 
 
-class ProductListResponse(BaseModel):
+class ProductBulkSaveRequest(BaseModel):
     products: List[GiftProduct]
+    created_by: Optional[str] = "admin"
+
+
+class GiftProductListItem(BaseModel):
+    """Listing projection of GiftProduct for the admin products table."""
+    id: str
+    name: str
+    price: float
+    image_url: Optional[str] = None
+    rating: Optional[float] = None
+    in_stock: bool = True
+    categories: List[str] = []
+
+
+class ProductListResponse(BaseModel):
+    products: List[GiftProductListItem]
     total: int
     page: int
     page_size: int
@@ -1,51 +1,166 @@
 # app/admin_products.py
 # Product management service for Supabase
 
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 import logging
+import re
 from datetime import datetime
 from supabase import Client
 from app.database import get_supabase
-from app.admin_models import GiftProduct, ProductListResponse
+from app.admin_models import CATEGORIES_BY_ID, GiftProduct, GiftProductListItem, ProductListResponse, RecipientInfo
+from app.cache import (
+    cache_get,
+    cache_set,
+    cache_delete,
+    hash_key,
+    get_namespace_version,
+    bump_namespace_version,
+)
 
 logger = logging.getLogger(__name__)
 
 TABLE_GIFTS = "gifts"
 
+# Cache settings — the catalog only changes on admin writes, so list pages and
+# single products are served from Redis until a mutation bumps the version.
+PRODUCTS_CACHE_NAMESPACE = "products"
+PRODUCTS_CACHE_TTL = 300
 
-def get_next_gift_id() -> str:
+# Columns the admin list can be sorted by — each one is backed by an index
+SORTABLE_COLUMNS = {"created_at", "price", "rating", "name"}
+DEFAULT_SORT_COLUMN = "created_at"
+
+# Columns fetched for the listing projection (GiftProductListItem).
+# categories come back dictionary-encoded as smallints and are decoded here.
+LIST_COLUMNS = "id,name,price,image_url,rating,in_stock,categories_ids"
+
+_CATEGORY_IDS = {name: i for i, name in enumerate(CATEGORIES_BY_ID, start=1)}
+
+# Columns fetched for exports — the GiftProduct shape, without the embedding
+# and search_doc columns
+EXPORT_COLUMNS = ",".join(GiftProduct.model_fields)
+
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+
+def _build_search_tsquery(search: str) -> str:
     """
-    Get the next gift ID (gift_XXXX).
+    Turn free-text input into a prefix-matching tsquery for search_doc.
 
-    Returns:
-        Next sequential gift ID
+    Only word characters survive, so user input cannot inject tsquery
+    operators or PostgREST filter syntax. Each word matches as a prefix
+    ("coff" finds "coffee") and all words must match.
     """
-    try:
-        supabase = get_supabase()
+    return " & ".join(f"{token}:*" for token in _SEARCH_TOKEN.findall(search.lower()))
 
-        # Get the last gift ID
-        result = supabase.table(TABLE_GIFTS)\
-            .select("id")\
-            .like("id", "gift_%")\
-            .order("id", desc=True)\
-            .limit(1)\
-            .execute()
 
-        if not result.data:
-            return "gift_0001"
+def _apply_product_filters(query, search: Optional[str], category: Optional[str], in_stock_only: bool):
+    """Apply the admin list/export filters to a gifts select query."""
+    if in_stock_only:
+        query = query.eq("in_stock", True)
 
-        last_id = result.data[0]["id"]
-        # Extract number and increment
-        last_num = int(last_id.split("_")[1])
-        next_num = last_num + 1
+    if category:
+        category_id = _CATEGORY_IDS.get(category)
+        if category_id is not None:
+            query = query.contains("categories_ids", [category_id])
+        else:
+            query = query.contains("categories", [category])
 
-        return f"gift_{next_num:04d}"
+    if search:
+        # One GIN probe on the generated search_doc column instead of
+        # three OR'd ILIKEs across name/description/brand
+        tsquery = _build_search_tsquery(search)
+        if tsquery:
+            query = query.text_search("search_doc", tsquery, options={"config": "simple"})
 
-    except Exception as e:
-        logger.error(f"Error getting next gift ID: {str(e)}")
-        # Fallback to timestamp-based ID
-        timestamp = int(datetime.utcnow().timestamp())
-        return f"gift_{timestamp % 10000:04d}"
+    return query
+
+
+def _list_item_from_row(row: dict) -> GiftProductListItem:
+    """Build a listing item from a projected row, decoding categories_ids."""
+    ids = row.pop("categories_ids", None) or ()
+    row["categories"] = [CATEGORIES_BY_ID[i - 1] for i in ids]
+    return GiftProductListItem.model_construct(**row)
+
+
+def _product_cache_key(product_id: str) -> str:
+    return f"product:{product_id}"
+
+
+def invalidate_product_cache(product_id: Optional[str] = None) -> None:
+    """
+    Invalidate cached product listings (and optionally a single product).
+
+    Args:
+        product_id: Product ID whose detail entry should also be dropped
+    """
+    bump_namespace_version(PRODUCTS_CACHE_NAMESPACE)
+    if product_id:
+        cache_delete(_product_cache_key(product_id))
+
+
+def _product_to_row(product: GiftProduct, created_by: str) -> dict:
+    """
+    Build the insert payload for a product.
+
+    created_at/updated_at are left to the column defaults and the
+    updated_at trigger; id is left to gift_id_seq unless one was provided.
+    """
+    data = {
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "currency": product.currency,
+        "categories": product.categories,
+        "interests": product.interests,
+        "occasions": product.occasions,
+        "vibe": product.vibe,
+        "personality_traits": product.personality_traits,
+        "recipient": product.recipient.model_dump(),
+        "experience_level": product.experience_level,
+        "brand": product.brand,
+        "link": product.link,
+        "image_url": product.image_url,
+        "source": product.source,
+        "rating": product.rating,
+        "review_count": product.review_count,
+        "in_stock": product.in_stock,
+        "created_by": created_by,
+    }
+
+    if product.id:
+        data["id"] = product.id
+
+    return data
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _product_from_row(row: dict) -> GiftProduct:
+    """
+    Build a GiftProduct from a trusted DB row without re-running validation.
+
+    Rows were validated on the way in (and by the array CHECK trigger), so
+    model_construct is safe here and much cheaper on the list hot path.
+    """
+    return GiftProduct.model_construct(**{
+        **row,
+        "recipient": RecipientInfo.model_construct(**(row.get("recipient") or {})),
+        "created_at": _parse_timestamp(row.get("created_at")),
+        "updated_at": _parse_timestamp(row.get("updated_at")),
+    })
+
+
+def _apply_saved_row(product: GiftProduct, saved_data: dict) -> GiftProduct:
+    """Copy DB-assigned fields (id, timestamps) back onto the product."""
+    product.id = saved_data["id"]
+    product.created_at = _parse_timestamp(saved_data["created_at"])
+    product.updated_at = _parse_timestamp(saved_data["updated_at"])
+    return product
 
 
 def save_product(product: GiftProduct, created_by: str = "admin") -> GiftProduct:
@@ -65,48 +180,17 @@ def save_product(product: GiftProduct, created_by: str = "admin") -> GiftProduct
     try:
         supabase = get_supabase()
 
-        # Generate ID if not provided
-        if not product.id:
-            product.id = get_next_gift_id()
-
-        # Prepare data for Supabase
-        data = {
-            "id": product.id,
-            "name": product.name,
-            "description": product.description,
-            "price": product.price,
-            "currency": product.currency,
-            "categories": product.categories,
-            "interests": product.interests,
-            "occasions": product.occasions,
-            "vibe": product.vibe,
-            "personality_traits": product.personality_traits,
-            "recipient": product.recipient.dict(),
-            "experience_level": product.experience_level,
-            "brand": product.brand,
-            "link": product.link,
-            "image_url": product.image_url,
-            "source": product.source,
-            "rating": product.rating,
-            "review_count": product.review_count,
-            "in_stock": product.in_stock,
-            "created_by": created_by,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
-        }
-
         # Insert into database
-        result = supabase.table(TABLE_GIFTS).insert(data).execute()
+        result = supabase.table(TABLE_GIFTS).insert(_product_to_row(product, created_by)).execute()
 
         if not result.data:
             raise ValueError("Failed to save product - no data returned")
 
-        logger.info(f"Product saved successfully: {product.id} - {product.name}")
-
         # Return the saved product
-        saved_data = result.data[0]
-        product.created_at = datetime.fromisoformat(saved_data["created_at"].replace("Z", "+00:00"))
-        product.updated_at = datetime.fromisoformat(saved_data["updated_at"].replace("Z", "+00:00"))
+        _apply_saved_row(product, result.data[0])
+
+        logger.info(f"Product saved successfully: {product.id} - {product.name}")
+        invalidate_product_cache(product.id)
 
         return product
 
@@ -115,6 +199,46 @@ def save_product(product: GiftProduct, created_by: str = "admin") -> GiftProduct
         raise ValueError(f"Failed to save product: {str(e)}")
 
 
+def save_products_bulk(products: List[GiftProduct], created_by: str = "admin") -> List[GiftProduct]:
+    """
+    Save many products in a single insert round-trip.
+
+    Args:
+        products: Gift products to save
+        created_by: Username of creator
+
+    Returns:
+        Saved products with generated IDs, in input order
+
+    Raises:
+        ValueError: If save fails
+    """
+    if not products:
+        return []
+
+    try:
+        supabase = get_supabase()
+
+        payloads = [_product_to_row(product, created_by) for product in products]
+        result = supabase.table(TABLE_GIFTS).insert(payloads).execute()
+
+        if not result.data or len(result.data) != len(products):
+            raise ValueError("Failed to save products - incomplete data returned")
+
+        # PostgREST returns inserted rows in payload order
+        for product, saved_data in zip(products, result.data):
+            _apply_saved_row(product, saved_data)
+
+        logger.info(f"Bulk saved {len(products)} products")
+        invalidate_product_cache()
+
+        return products
+
+    except Exception as e:
+        logger.error(f"Error bulk saving products: {str(e)}")
+        raise ValueError(f"Failed to save products: {str(e)}")
+
+
 def get_product(product_id: str) -> Optional[GiftProduct]:
     """
     Get a product by ID.
@@ -125,6 +249,11 @@ def get_product(product_id: str) -> Optional[GiftProduct]:
     Returns:
         GiftProduct if found, None otherwise
     """
+    cache_key = _product_cache_key(product_id)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return GiftProduct.model_validate_json(cached)
+
     try:
         supabase = get_supabase()
 
@@ -136,14 +265,55 @@ def get_product(product_id: str) -> Optional[GiftProduct]:
         if not result.data:
             return None
 
-        data = result.data[0]
-        return GiftProduct(**data)
+        product = _product_from_row(result.data[0])
+        cache_set(cache_key, product.model_dump_json(), PRODUCTS_CACHE_TTL)
+        return product
 
     except Exception as e:
         logger.error(f"Error getting product {product_id}: {str(e)}")
         return None
 
 
+def get_product_quality_fields(product_id: str) -> Optional[Tuple[Optional[float], Optional[int], bool]]:
+    """
+    Get just the quality inputs (rating, review_count, in_stock) for a product.
+
+    Served from the product detail cache when warm; otherwise a narrow
+    select instead of fetching and validating the whole row.
+
+    Args:
+        product_id: Product ID
+
+    Returns:
+        (rating, review_count, in_stock) if found, None otherwise
+    """
+    cached = cache_get(_product_cache_key(product_id))
+    if cached is not None:
+        product = GiftProduct.model_validate_json(cached)
+        return product.rating, product.review_count, product.in_stock
+
+    try:
+        supabase = get_supabase()
+
+        result = supabase.table(TABLE_GIFTS)\
+            .select("rating,review_count,in_stock")\
+            .eq("id", product_id)\
+            .maybe_single()\
+            .execute()
+
+        # maybe_single() returns None (not an empty response) on no match
+        if not result or not result.data:
+            return None
+
+        row = result.data
+        rating = float(row["rating"]) if row.get("rating") is not None else None
+        return rating, row.get("review_count"), bool(row.get("in_stock", True))
+
+    except Exception as e:
+        logger.error(f"Error fetching quality fields for {product_id}: {str(e)}")
+        return None
+
+
 def list_products(
     page: int = 1,
     page_size: int = 20,
@@ -159,7 +329,7 @@ def list_products(
     Args:
         page: Page number (1-indexed)
         page_size: Items per page
-        sort_by: Field to sort by
+        sort_by: Field to sort by (one of SORTABLE_COLUMNS)
         sort_desc: Sort descending if True
         search: Search query for name/description/brand
         category: Filter by category
@@ -168,57 +338,111 @@ def list_products(
     Returns:
         ProductListResponse with products and pagination info
     """
+    if sort_by not in SORTABLE_COLUMNS:
+        logger.warning(f"Unsupported sort column '{sort_by}' - using {DEFAULT_SORT_COLUMN}")
+        sort_by = DEFAULT_SORT_COLUMN
+
+    params = [page, page_size, sort_by, sort_desc, search, category, in_stock_only]
+    version = get_namespace_version(PRODUCTS_CACHE_NAMESPACE)
+    cache_key = f"{PRODUCTS_CACHE_NAMESPACE}:v{version}:{hash_key(params)}"
+
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return ProductListResponse.model_validate_json(cached)
+
     try:
         supabase = get_supabase()
 
         # Build query
-        query = supabase.table(TABLE_GIFTS).select("*", count="exact")
+        query = supabase.table(TABLE_GIFTS).select(LIST_COLUMNS, count="exact")
 
         # Apply filters
-        if in_stock_only:
-            query = query.eq("in_stock", True)
-
-        if category:
-            query = query.contains("categories", [category])
-
-        if search:
-            # Simple text search (you can enhance this with full-text search)
-            query = query.or_(
-                f"name.ilike.%{search}%,"
-                f"description.ilike.%{search}%,"
-                f"brand.ilike.%{search}%"
-            )
-
-        # Count total
-        count_result = query.execute()
-        total = count_result.count if hasattr(count_result, 'count') else len(count_result.data)
+        query = _apply_product_filters(query, search, category, in_stock_only)
 
-        # Apply sorting
-        query = query.order(sort_by, desc=sort_desc)
-
-        # Apply pagination
+        # Apply sorting and pagination — the exact total comes back in the
+        # Content-Range header of this same request, so no separate count query
         offset = (page - 1) * page_size
-        query = query.range(offset, offset + page_size - 1)
+        result = query\
+            .order(sort_by, desc=sort_desc)\
+            .order("id", desc=sort_desc)\
+            .range(offset, offset + page_size - 1)\
+            .execute()
 
-        # Execute query
-        result = query.execute()
+        total = result.count if result.count is not None else len(result.data)
 
-        products = [GiftProduct(**item) for item in result.data]
+        products = [_list_item_from_row(item) for item in result.data]
 
         logger.info(f"Listed {len(products)} products (page {page}/{(total + page_size - 1) // page_size})")
 
-        return ProductListResponse(
+        response = ProductListResponse(
             products=products,
             total=total,
             page=page,
             page_size=page_size
         )
+        cache_set(cache_key, response.model_dump_json(), PRODUCTS_CACHE_TTL)
+
+        return response
 
     except Exception as e:
         logger.error(f"Error listing products: {str(e)}")
         return ProductListResponse(products=[], total=0, page=page, page_size=page_size)
 
 
+def iter_products(
+    *,
+    chunk: int = 500,
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    in_stock_only: bool = False
+) -> Iterator[dict]:
+    """
+    Yield every matching product row, newest first, in chunks.
+
+    Uses keyset pagination on (created_at, id) rather than OFFSET, so each
+    chunk is an index range scan on idx_gifts_created_at_id and memory stays
+    O(chunk) regardless of catalog size. Relies on created_at being NOT NULL
+    (see supabase_products_schema.sql); NULL rows would never match the cursor.
+
+    Args:
+        chunk: Rows fetched per round-trip
+        search: Search query for name/description/brand
+        category: Filter by category
+        in_stock_only: Only include in-stock products
+
+    Yields:
+        Product rows shaped like GiftProduct
+    """
+    supabase = get_supabase()
+    cursor: Optional[tuple] = None
+
+    while True:
+        query = supabase.table(TABLE_GIFTS).select(EXPORT_COLUMNS)
+        query = _apply_product_filters(query, search, category, in_stock_only)
+
+        if cursor:
+            last_ts, last_id = cursor
+            # (created_at, id) < (last_ts, last_id); values are quoted because
+            # timestamps contain PostgREST-reserved characters
+            query = query.or_(
+                f'created_at.lt."{last_ts}",'
+                f'and(created_at.eq."{last_ts}",id.lt."{last_id}")'
+            )
+
+        result = query\
+            .order("created_at", desc=True)\
+            .order("id", desc=True)\
+            .limit(chunk)\
+            .execute()
+
+        rows = result.data or []
+        yield from rows
+
+        if len(rows) < chunk:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+
 def update_product(product_id: str, updates: dict) -> bool:
     """
     Update an existing product.
@@ -233,9 +457,6 @@ def update_product(product_id: str, updates: dict) -> bool:
     try:
         supabase = get_supabase()
 
-        # Add updated_at timestamp
-        updates["updated_at"] = datetime.utcnow().isoformat()
-
         result = supabase.table(TABLE_GIFTS)\
             .update(updates)\
             .eq("id", product_id)\
@@ -246,6 +467,7 @@ def update_product(product_id: str, updates: dict) -> bool:
             return False
 
         logger.info(f"Product {product_id} updated successfully")
+        invalidate_product_cache(product_id)
         return True
 
     except Exception as e:
@@ -276,6 +498,7 @@ def delete_product(product_id: str) -> bool:
             return False
 
         logger.info(f"Product {product_id} deleted successfully")
+        invalidate_product_cache(product_id)
         return True
 
     except Exception as e:
@@ -293,35 +516,10 @@ def get_product_stats() -> dict:
     try:
         supabase = get_supabase()
 
-        # Total products
-        result = supabase.table(TABLE_GIFTS).select("*", count="exact").execute()
-        total = result.count if hasattr(result, 'count') else len(result.data)
-
-        # In stock
-        in_stock_result = supabase.table(TABLE_GIFTS)\
-            .select("*", count="exact")\
-            .eq("in_stock", True)\
-            .execute()
-        in_stock = in_stock_result.count if hasattr(in_stock_result, 'count') else len(in_stock_result.data)
-
-        # Average rating
-        all_products = result.data
-        ratings = [p.get("rating") for p in all_products if p.get("rating") is not None]
-        avg_rating = sum(ratings) / len(ratings) if ratings else 0
-
-        # Category distribution
-        category_counts = {}
-        for product in all_products:
-            for category in product.get("categories", []):
-                category_counts[category] = category_counts.get(category, 0) + 1
-
-        return {
-            "total_products": total,
-            "in_stock": in_stock,
-            "out_of_stock": total - in_stock,
-            "average_rating": round(avg_rating, 2),
-            "category_distribution": category_counts
-        }
+        # Aggregates are computed in Postgres (see get_gift_stats in
+        # supabase_products_schema.sql) so only one small JSON row comes back
+        result = supabase.rpc("get_gift_stats").execute()
+        return result.data
 
     except Exception as e:
         logger.error(f"Error getting product stats: {str(e)}")
@@ -1,22 +1,20 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
 from openai.types.chat import (
     ChatCompletionSystemMessageParam,
     ChatCompletionUserMessageParam
 )
+from app.cache import redis_memoize
+from app.openai_client import async_client
 
-load_dotenv(r"C:\Users\camry\PycharmProjects\PythonProject\gift-ai-backend\.env")
+client = async_client.with_options(max_retries=2, timeout=30.0)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def run_gift_recommender(prompt: str) -> str:
-    response = client.chat.completions.create(
+@redis_memoize("recommender", ttl=86400)
+async def run_gift_recommender(prompt: str) -> str:
+    response = await client.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[
             ChatCompletionSystemMessageParam(role="system", content="You output only valid JSON"),
             ChatCompletionUserMessageParam(role="user", content=prompt)
-        ]
+        ],
+        response_format={"type": "json_object"}
     )
     return response.choices[0].message.content
-
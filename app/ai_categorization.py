@@ -1,56 +1,163 @@
 # app/ai_categorization.py
 # AI-powered product categorization using OpenAI
 
-import json
+import asyncio
 import logging
-from openai import OpenAI
+from typing import List
 import os
-from dotenv import load_dotenv
-from app.admin_models import AICategorizationResponse, RecipientInfo
-
-load_dotenv()
+import msgspec
+from app.admin_models import (
+    AICategorizationResponse,
+    Gender,
+    RecipientInfo,
+    Relationship,
+    CATEGORIES as _VALID_CATEGORIES,
+    INTERESTS as _VALID_INTERESTS,
+    OCCASIONS as _VALID_OCCASIONS,
+    GENDERS as _VALID_GENDERS,
+    RELATIONSHIPS as _VALID_RELATIONSHIPS,
+    VIBES as _VALID_VIBES,
+    PERSONALITY_TRAITS as _VALID_TRAITS,
+    EXPERIENCE_LEVELS as _VALID_EXPERIENCE,
+)
+from app.cache import redis_memoize
+from app.openai_client import async_client
+from app.embeddings import generate_embedding
+from app.semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-CATEGORIZATION_PROMPT_TEMPLATE = """Based on this product:
-Title: {product_name}
+# The shared async client (and its HTTP/2 connection pool), with more retries
+# since batch categorization is prone to rate limiting
+client = async_client.with_options(max_retries=5)
+
+# Near-duplicate products (same family, reworded titles) reuse a prior
+# categorization instead of another chat completion
+categorization_cache = SemanticCache(
+    threshold=float(os.getenv("CATEGORIZATION_CACHE_THRESHOLD", "0.92")),
+    capacity=int(os.getenv("CATEGORIZATION_CACHE_SIZE", "5000")),
+    path=os.getenv("CATEGORIZATION_CACHE_PATH"),
+)
+
+# Static instructions go in the system message and must stay byte-identical
+# across requests so the provider can reuse its cached prompt prefix; only the
+# per-product fields below vary, and they come last.
+CATEGORIZATION_SYSTEM_PROMPT = """You are a gift categorization expert. Tag the product you are given for a gift recommendation database. Reply with a JSON object with keys categories, interests, occasions, recipient (with gender and relationship), vibe, personality_traits, experience_level.
+
+Use only these values and respect the limits:
+- categories (max 2): tech, home, kitchen, fashion, beauty, fitness, outdoors, hobby, book, experiences
+- interests (max 5): coffee, cooking, baking, fitness, running, yoga, gaming, photography, music, travel, reading, art, gardening, cycling, hiking, camping, movies, wine, cocktails, tea, fashion, skincare, makeup
+- occasions (max 4): birthday, anniversary, valentines, holiday, christmas, wedding, engagement, graduation, just_because
+- recipient.gender (1-3): male, female, unisex
+- recipient.relationship (1-6): partner, spouse, boyfriend, girlfriend, friend, family
+- vibe (max 3): romantic, practical, luxury, fun, sentimental, creative, cozy, adventurous, minimalist
+- personality_traits (max 3): introverted, extroverted, analytical, creative, sentimental, adventurous, organized, relaxed, curious
+- experience_level (exactly 1): beginner, enthusiast, expert
+
+Be selective: pick only the most relevant values for who would actually use this product in typical gift-giving scenarios, and match experience_level to product complexity."""
+
+CATEGORIZATION_PROMPT_TEMPLATE = """Title: {product_name}
 Description: {description}
-Brand: {brand}
-
-Suggest appropriate values for a gift recommendation database.
-
-Return ONLY valid JSON (no markdown, no explanation, no code blocks):
-{{
-  "categories": [],
-  "interests": [],
-  "occasions": [],
-  "recipient": {{
-    "gender": [],
-    "relationship": []
-  }},
-  "vibe": [],
-  "personality_traits": [],
-  "experience_level": ""
-}}
-
-STRICT Guidelines (follow these limits exactly):
-- categories: Pick MAXIMUM 2 from [tech, home, kitchen, fashion, beauty, fitness, outdoors, hobby, book, experiences]
-- interests: Pick MAXIMUM 5 from [coffee, cooking, baking, fitness, running, yoga, gaming, photography, music, travel, reading, art, gardening, cycling, hiking, camping, movies, wine, cocktails, tea, fashion, skincare, makeup]
-- occasions: Pick MAXIMUM 4 from [birthday, anniversary, valentines, holiday, christmas, wedding, engagement, graduation, just_because]
-- recipient.gender: Pick 1-3 from [male, female, unisex]
-- recipient.relationship: Pick 1-6 from [partner, spouse, boyfriend, girlfriend, friend, family]
-- vibe: Pick MAXIMUM 3 from [romantic, practical, luxury, fun, sentimental, creative, cozy, adventurous, minimalist]
-- personality_traits: Pick MAXIMUM 3 from [introverted, extroverted, analytical, creative, sentimental, adventurous, organized, relaxed, curious]
-- experience_level: Pick EXACTLY 1 from [beginner, enthusiast, expert]
-
-Rules:
-1. Be selective - choose only the MOST relevant categories
-2. Consider who would actually use/appreciate this product
-3. Think about typical gift-giving scenarios
-4. Match experience_level to product complexity
-5. Return ONLY the JSON, nothing else"""
+Brand: {brand}"""
+
+
+class _RecipientPayload(msgspec.Struct):
+    gender: List[Gender] = []
+    relationship: List[Relationship] = []
+
+
+class _CategorizationPayload(msgspec.Struct):
+    """Shape of the model's JSON reply; unknown keys are ignored."""
+    categories: List[str] = []
+    interests: List[str] = []
+    occasions: List[str] = []
+    recipient: _RecipientPayload = msgspec.field(default_factory=_RecipientPayload)
+    vibe: List[str] = []
+    personality_traits: List[str] = []
+    experience_level: str = "beginner"
+
+
+@redis_memoize(
+    "categorize",
+    ttl=86400,
+    serialize=lambda r: r.model_dump_json(),
+    deserialize=AICategorizationResponse.model_validate_json,
+)
+async def _categorize_with_openai(
+    product_name: str,
+    description: str = "",
+    brand: str = ""
+) -> AICategorizationResponse:
+    """
+    Call OpenAI to categorize a product. Successful results are cached in
+    Redis keyed by the normalized (name, description, brand), and in the
+    semantic cache so near-duplicate products skip the completion.
+
+    Raises:
+        ValueError: If OpenAI returns invalid JSON
+    """
+    # Semantic lookup before paying for a completion
+    cache_text = f"{product_name} | {brand} | {description[:500]}"
+    embedding = await asyncio.to_thread(generate_embedding, cache_text)
+    if embedding:
+        cached = categorization_cache.lookup(embedding)
+        if cached is not None:
+            return AICategorizationResponse.model_validate_json(cached)
+
+    # Build prompt
+    prompt = CATEGORIZATION_PROMPT_TEMPLATE.format(
+        product_name=product_name,
+        description=description[:500],  # Limit description length
+        brand=brand or "Unknown"
+    )
+
+    # Call OpenAI (JSON mode guarantees a bare JSON object — no fences to strip)
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": CATEGORIZATION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.3,  # Lower temperature for more consistent results
+        max_tokens=200  # A full reply is ~120 tokens
+    )
+
+    content = response.choices[0].message.content
+
+    logger.debug(f"OpenAI response: {content}")
+
+    # Decode and type-check the JSON in a single C pass
+    try:
+        payload = msgspec.json.decode(content, type=_CategorizationPayload)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        logger.error(f"Failed to parse OpenAI response as JSON: {content}")
+        raise ValueError(f"OpenAI returned invalid JSON: {str(e)}")
+
+    # Already validated by msgspec, so skip pydantic validation
+    categorization = AICategorizationResponse.model_construct(
+        categories=payload.categories[:2],  # Enforce max 2
+        interests=payload.interests[:5],  # Enforce max 5
+        occasions=payload.occasions[:4],  # Enforce max 4
+        recipient=RecipientInfo.model_construct(
+            gender=payload.recipient.gender[:3],
+            relationship=payload.recipient.relationship[:6]
+        ),
+        vibe=payload.vibe[:3],  # Enforce max 3
+        personality_traits=payload.personality_traits[:3],  # Enforce max 3
+        experience_level=payload.experience_level
+    )
+
+    if embedding:
+        categorization_cache.insert(embedding, categorization.model_dump_json())
+
+    return categorization
 
 
 async def categorize_product(
@@ -68,69 +175,12 @@ async def categorize_product(
 
     Returns:
         AICategorizationResponse with suggested categories
-
-    Raises:
-        ValueError: If OpenAI API fails or returns invalid JSON
+        (safe defaults if the OpenAI call fails)
     """
     logger.info(f"Categorizing product: {product_name[:50]}...")
 
-    # Build prompt
-    prompt = CATEGORIZATION_PROMPT_TEMPLATE.format(
-        product_name=product_name,
-        description=description[:500],  # Limit description length
-        brand=brand or "Unknown"
-    )
-
     try:
-        # Call OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a gift categorization expert. Return only valid JSON with no markdown formatting or explanations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,  # Lower temperature for more consistent results
-            max_tokens=500
-        )
-
-        # Extract content
-        content = response.choices[0].message.content.strip()
-
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        content = content.strip()
-
-        logger.debug(f"OpenAI response: {content}")
-
-        # Parse JSON
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse OpenAI response as JSON: {content}")
-            raise ValueError(f"OpenAI returned invalid JSON: {str(e)}")
-
-        # Validate and construct response
-        categorization = AICategorizationResponse(
-            categories=data.get("categories", [])[:2],  # Enforce max 2
-            interests=data.get("interests", [])[:5],  # Enforce max 5
-            occasions=data.get("occasions", [])[:4],  # Enforce max 4
-            recipient=RecipientInfo(
-                gender=data.get("recipient", {}).get("gender", [])[:3],
-                relationship=data.get("recipient", {}).get("relationship", [])[:6]
-            ),
-            vibe=data.get("vibe", [])[:3],  # Enforce max 3
-            personality_traits=data.get("personality_traits", [])[:3],  # Enforce max 3
-            experience_level=data.get("experience_level", "beginner")
-        )
+        categorization = await _categorize_with_openai(product_name, description, brand)
 
         logger.info(f"Categorization successful: {len(categorization.categories)} categories, {len(categorization.interests)} interests")
 
@@ -138,7 +188,7 @@ async def categorize_product(
 
     except Exception as e:
         logger.error(f"AI categorization failed: {str(e)}")
-        # Return safe defaults if AI fails
+        # Return safe defaults if AI fails (never cached)
         return AICategorizationResponse(
             categories=[],
             interests=[],
@@ -159,33 +209,22 @@ def validate_categorization(categorization: dict) -> dict:
     - Values are from allowed lists
     - Required fields are present
     """
-    # Valid values for each field
-    VALID_CATEGORIES = ["tech", "home", "kitchen", "fashion", "beauty", "fitness", "outdoors", "hobby", "book", "experiences"]
-    VALID_INTERESTS = ["coffee", "cooking", "baking", "fitness", "running", "yoga", "gaming", "photography", "music", "travel", "reading", "art", "gardening", "cycling", "hiking", "camping", "movies", "wine", "cocktails", "tea", "fashion", "skincare", "makeup"]
-    VALID_OCCASIONS = ["birthday", "anniversary", "valentines", "holiday", "christmas", "wedding", "engagement", "graduation", "just_because"]
-    VALID_GENDERS = ["male", "female", "unisex"]
-    VALID_RELATIONSHIPS = ["partner", "spouse", "boyfriend", "girlfriend", "friend", "family"]
-    VALID_VIBES = ["romantic", "practical", "luxury", "fun", "sentimental", "creative", "cozy", "adventurous", "minimalist"]
-    VALID_TRAITS = ["introverted", "extroverted", "analytical", "creative", "sentimental", "adventurous", "organized", "relaxed", "curious"]
-    VALID_EXPERIENCE = ["beginner", "enthusiast", "expert"]
-
-    def filter_valid(values: list, valid_list: list, max_count: int) -> list:
+    def filter_valid(values: list, valid_set: frozenset, max_count: int) -> list:
         """Filter to only valid values and enforce max count."""
-        filtered = [v for v in values if v in valid_list]
-        return filtered[:max_count]
+        return [v for v in values if v in valid_set][:max_count]
 
     # Clean and validate
     cleaned = {
-        "categories": filter_valid(categorization.get("categories", []), VALID_CATEGORIES, 2),
-        "interests": filter_valid(categorization.get("interests", []), VALID_INTERESTS, 5),
-        "occasions": filter_valid(categorization.get("occasions", []), VALID_OCCASIONS, 4),
+        "categories": filter_valid(categorization.get("categories", []), _VALID_CATEGORIES, 2),
+        "interests": filter_valid(categorization.get("interests", []), _VALID_INTERESTS, 5),
+        "occasions": filter_valid(categorization.get("occasions", []), _VALID_OCCASIONS, 4),
         "recipient": {
-            "gender": filter_valid(categorization.get("recipient", {}).get("gender", []), VALID_GENDERS, 3),
-            "relationship": filter_valid(categorization.get("recipient", {}).get("relationship", []), VALID_RELATIONSHIPS, 6)
+            "gender": filter_valid(categorization.get("recipient", {}).get("gender", []), _VALID_GENDERS, 3),
+            "relationship": filter_valid(categorization.get("recipient", {}).get("relationship", []), _VALID_RELATIONSHIPS, 6)
         },
-        "vibe": filter_valid(categorization.get("vibe", []), VALID_VIBES, 3),
-        "personality_traits": filter_valid(categorization.get("personality_traits", []), VALID_TRAITS, 3),
-        "experience_level": categorization.get("experience_level", "beginner") if categorization.get("experience_level") in VALID_EXPERIENCE else "beginner"
+        "vibe": filter_valid(categorization.get("vibe", []), _VALID_VIBES, 3),
+        "personality_traits": filter_valid(categorization.get("personality_traits", []), _VALID_TRAITS, 3),
+        "experience_level": categorization.get("experience_level", "beginner") if categorization.get("experience_level") in _VALID_EXPERIENCE else "beginner"
     }
 
     return cleaned
@@ -1,10 +1,13 @@
 import httpx
 import re
-from bs4 import BeautifulSoup
+import copy
+from functools import lru_cache
+from cachetools import TTLCache
+from selectolax.lexbor import LexborHTMLParser
 from typing import Optional, Dict
 import logging
 import random
-import time
+import asyncio
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +19,62 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
 ]
 
-
+# Patterns compiled once at import rather than looked up per call
+_ASIN_RE = re.compile(r'/(?:dp|gp/product)/([A-Z0-9]{10})')
+# Thousands-separated or plain numbers, captured in one pass so only the
+# matched group (not the whole element text) needs its commas stripped
+_PRICE_RE = re.compile(r'[$£€]?\s*(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)')
+_WHITESPACE_RE = re.compile(r'\s+')
+_BRAND_PREFIX_RE = re.compile(r'^(Visit the |Brand: )')
+_RATING_RE = re.compile(r'(\d+(?:\.\d+)?)\s*out of\s*5')
+_REVIEW_COUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})+|\d+)\s*ratings?')
+
+# CSS fallback chains, tried in order (first non-empty match wins)
+_NAME_SELECTORS = ("#productTitle", "#title", ".product-title-word-break")
+_PRICE_SELECTORS = (".a-price-whole", ".a-offscreen")
+_DESC_SELECTORS = ("#feature-bullets", "#productDescription")
+_IMAGE_SELECTORS = ("img#landingImage", "img.a-dynamic-image")
+_BRAND_SELECTORS = ("a#bylineInfo",)
+_RATING_SELECTORS = ("span.a-icon-alt",)
+_REVIEW_SELECTORS = ("span#acrCustomerReviewText",)
+
+# Every selector above is a simple "[tag]#id" or "[tag].class", so all of them
+# are matched in one combined query and dispatched by id/class afterwards
+_ALL_SELECTORS = (_NAME_SELECTORS + _PRICE_SELECTORS + _DESC_SELECTORS + _IMAGE_SELECTORS
+                  + _BRAND_SELECTORS + _RATING_SELECTORS + _REVIEW_SELECTORS)
+_COMBINED_SELECTOR = ", ".join(_ALL_SELECTORS)
+_WANTED_SELECTORS = frozenset(_ALL_SELECTORS)
+
+
+# Pages advertising a larger (possibly compressed) body are not downloaded
+MAX_PAGE_BYTES = 2_000_000
+
+# Shared client so repeat scrapes reuse pooled keep-alive (and HTTP/2)
+# connections instead of a fresh TCP + TLS handshake per product.
+# Headers are still rotated per request.
+_http = httpx.AsyncClient(
+    timeout=15.0,
+    follow_redirects=True,
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30.0),
+)
+
+
+async def close_http_client() -> None:
+    """Close the shared scraper client (called on app shutdown)."""
+    await _http.aclose()
+
+
+# Recent scrapes keyed by ASIN (or URL when no ASIN), so re-imports and
+# retries within the hour skip the fetch and parse entirely
+_scrape_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+
+@lru_cache(maxsize=4096)
 def extract_asin_from_url(url: str) -> Optional[str]:
     """Extract ASIN from Amazon URL."""
     # Pattern: /dp/{ASIN} or /gp/product/{ASIN}
-    match = re.search(r'/(?:dp|gp/product)/([A-Z0-9]{10})', url)
+    match = _ASIN_RE.search(url)
     if match:
         return match.group(1)
     return None
@@ -44,6 +98,27 @@ def get_random_headers():
     }
 
 
+def _match_selectors(tree: LexborHTMLParser) -> Dict:
+    """
+    Find the first node for every extraction selector in a single DOM query.
+
+    Returns:
+        Dict of selector -> first matching node in document order (the same
+        node tree.css_first(selector) would return); unmatched selectors are absent
+    """
+    found = {}
+    for node in tree.css(_COMBINED_SELECTOR):
+        attrs = node.attributes
+        keys = ["." + c for c in (attrs.get("class") or "").split()]
+        if attrs.get("id"):
+            keys.append("#" + attrs["id"])
+        for key in keys:
+            for selector in (key, node.tag + key):
+                if selector in _WANTED_SELECTORS and selector not in found:
+                    found[selector] = node
+    return found
+
+
 async def scrape_amazon_product(url: str) -> Dict:
     """
     Scrape product details from Amazon URL with improved anti-blocking.
@@ -53,151 +128,156 @@ async def scrape_amazon_product(url: str) -> Dict:
     if not url or "amazon.com" not in url.lower():
         raise ValueError("Invalid Amazon URL")
 
+    cache_key = extract_asin_from_url(url) or url
+    cached = _scrape_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Scrape cache HIT: %s" % cache_key)
+        product_data = copy.deepcopy(cached)
+        product_data["link"] = url
+        return product_data
+
     # Add small random delay to appear more human
-    time.sleep(random.uniform(0.5, 1.5))
+    await asyncio.sleep(random.uniform(0.5, 1.5))
 
     try:
-        async with httpx.AsyncClient(
-                timeout=15.0,
-                follow_redirects=True,
-                http2=True
-        ) as client:
-
-            logger.info("Fetching URL: %s" % url)
-            response = await client.get(url, headers=get_random_headers())
-
+        logger.info("Fetching URL: %s" % url)
+        # Streamed so oversized pages are rejected without reading them in
+        # full: from Content-Length when sent, otherwise (chunked) once the
+        # received bytes pass MAX_PAGE_BYTES
+        async with _http.stream("GET", url, headers=get_random_headers()) as response:
             if response.status_code == 503:
                 raise ValueError("Amazon is temporarily blocking requests. Try again in a few minutes.")
 
             if response.status_code != 200:
                 raise ValueError("Failed to fetch page (HTTP %d)" % response.status_code)
 
-            html = response.text
-
-            if "api-services-support@amazon.com" in html or "Enter the characters you see below" in html:
-                raise ValueError(
-                    "Amazon CAPTCHA detected. Please try again in a few minutes or use a different network.")
-
-            soup = BeautifulSoup(html, "html.parser")
-            product_data = {}
-
-            # --- Product Name ---
-            name = None
-            name_selectors = [
-                {"id": "productTitle"},
-                {"id": "title"},
-                {"class": "product-title-word-break"},
-            ]
-
-            for selector in name_selectors:
-                element = soup.find(**selector)
-                if element:
-                    name = element.get_text().strip()
-                    if name: break
-
-            if not name:
-                raise ValueError("Could not extract product name.")
-
-            product_data["name"] = name
-
-            # --- Price ---
-            price = 0.0
-            price_patterns = [{"class": "a-price-whole"}, {"class": "a-offscreen"}]
-
-            for pattern in price_patterns:
-                element = soup.find(**pattern)
-                if element:
-                    price_text = element.get_text().strip()
-                    match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                    if match:
-                        price = float(match.group())
-                        break
-            product_data["price"] = price
-
-            # --- Description ---
-            description = None
-            desc_selectors = [{"id": "feature-bullets"}, {"id": "productDescription"}]
-
-            for selector in desc_selectors:
-                element = soup.find(**selector)
-                if element:
-                    description = re.sub(r'\s+', ' ', element.get_text().strip())[:500]
+            if int(response.headers.get("content-length") or 0) > MAX_PAGE_BYTES:
+                raise ValueError("Product page too large")
+
+            # Raw bytes: the parser detects the encoding itself, so the page
+            # is never decoded into a Python str
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > MAX_PAGE_BYTES:
+                    raise ValueError("Product page too large")
+                chunks.append(chunk)
+            html = b"".join(chunks)
+
+        if b"api-services-support@amazon.com" in html or b"Enter the characters you see below" in html:
+            raise ValueError(
+                "Amazon CAPTCHA detected. Please try again in a few minutes or use a different network.")
+
+        tree = LexborHTMLParser(html)
+        found = _match_selectors(tree)
+        product_data = {}
+
+        # --- Product Name ---
+        name = None
+        for selector in _NAME_SELECTORS:
+            element = found.get(selector)
+            if element:
+                name = element.text().strip()
+                if name: break
+
+        if not name:
+            raise ValueError("Could not extract product name.")
+
+        product_data["name"] = name
+
+        # --- Price ---
+        price = 0.0
+        for selector in _PRICE_SELECTORS:
+            element = found.get(selector)
+            if element:
+                price_text = element.text().strip()
+                match = _PRICE_RE.search(price_text)
+                if match:
+                    price = float(match.group(1).replace(',', ''))
                     break
-            product_data["description"] = description or "No description available"
-
-            # --- Image URL ---
-            img_element = soup.find("img", {"id": "landingImage"}) or soup.find("img", {"class": "a-dynamic-image"})
-            product_data["image_url"] = img_element.get("src") if img_element else None
-
-            # --- Brand ---
-            brand = None
-            brand_element = soup.find("a", {"id": "bylineInfo"})
-            if brand_element:
-                brand_text = brand_element.get_text().strip()
-                brand = re.sub(r'^(Visit the |Brand: )', '', brand_text).replace(' Store', '').strip()
-            product_data["brand"] = brand
-
-            # --- NEW: ASIN Extraction ---
-            asin = extract_asin_from_url(url)
-            product_data["asin"] = asin
-            if asin:
-                logger.info("✓ Found ASIN: %s" % asin)
-
-            # --- Rating & Reviews ---
-            rating = None
-            rating_element = soup.find("span", {"class": "a-icon-alt"})
-            if rating_element:
-                match = re.search(r'([\d.]+)\s*out of\s*5', rating_element.get_text())
-                if match: rating = float(match.group(1))
-            product_data["rating"] = rating
-
-            review_count = None
-            review_element = soup.find("span", {"id": "acrCustomerReviewText"})
-            if review_element:
-                match = re.search(r'([\d,]+)\s*ratings?', review_element.get_text())
-                if match: review_count = int(match.group(1).replace(',', ''))
-            product_data["review_count"] = review_count
-
-            # Metadata and Defaults
-            product_data.update({
-                "link": url,
-                "source": "amazon",
-                "currency": "USD",
-                "in_stock": True,
-                "categories": [],
-                "interests": [],
-                "occasions": [],
-                "vibe": [],
-                "personality_traits": [],
-                "recipient": {}
-            })
-
-            return product_data
+        product_data["price"] = price
+
+        # --- Description ---
+        description = None
+        for selector in _DESC_SELECTORS:
+            element = found.get(selector)
+            if element:
+                description = _WHITESPACE_RE.sub(' ', element.text().strip())[:500]
+                break
+        product_data["description"] = description or "No description available"
+
+        # --- Image URL ---
+        img_element = next((found[s] for s in _IMAGE_SELECTORS if s in found), None)
+        product_data["image_url"] = img_element.attributes.get("src") if img_element else None
+
+        # --- Brand ---
+        brand = None
+        brand_element = found.get("a#bylineInfo")
+        if brand_element:
+            brand_text = brand_element.text().strip()
+            brand = _BRAND_PREFIX_RE.sub('', brand_text).replace(' Store', '').strip()
+        product_data["brand"] = brand
+
+        # --- NEW: ASIN Extraction ---
+        asin = extract_asin_from_url(url)
+        product_data["asin"] = asin
+        if asin:
+            logger.info("✓ Found ASIN: %s" % asin)
+
+        # --- Rating & Reviews ---
+        rating = None
+        rating_element = found.get("span.a-icon-alt")
+        if rating_element:
+            match = _RATING_RE.search(rating_element.text())
+            if match: rating = float(match.group(1))
+        product_data["rating"] = rating
+
+        review_count = None
+        review_element = found.get("span#acrCustomerReviewText")
+        if review_element:
+            match = _REVIEW_COUNT_RE.search(review_element.text())
+            if match: review_count = int(match.group(1).replace(',', ''))
+        product_data["review_count"] = review_count
+
+        # Metadata and Defaults
+        product_data.update({
+            "link": url,
+            "source": "amazon",
+            "currency": "USD",
+            "in_stock": True,
+            "categories": [],
+            "interests": [],
+            "occasions": [],
+            "vibe": [],
+            "personality_traits": [],
+            "recipient": {}
+        })
+
+        _scrape_cache[cache_key] = copy.deepcopy(product_data)
+        return product_data
 
     except Exception as e:
         logger.error("Scraping error: %s" % str(e))
         raise ValueError("Failed to scrape product: %s" % str(e))
 
 
-def get_quality_indicators(rating: Optional[float], review_count: Optional[int], in_stock: bool) -> Dict:
-    """Analyze product quality based on rating and reviews."""
-    indicators = {
-        "overall_quality": "unknown",
-        "rating_score": "N/A",
-        "review_score": "N/A",
-        "stock_status": "in_stock" if in_stock else "out_of_stock",
-        "recommended": False
-    }
-
-    if rating is not None:
-        indicators["rating_score"] = "excellent" if rating >= 4.5 else "good" if rating >= 4.0 else "average"
+# Score labels indexed by the number of thresholds a value clears
+_RATING_SCORES = ("average", "good", "excellent")  # >= 4.0, >= 4.5
+_REVIEW_SCORES = ("well_reviewed", "highly_reviewed")  # >= 1000
+_STOCK_STATUS = ("out_of_stock", "in_stock")
 
-    if review_count is not None:
-        indicators["review_score"] = "highly_reviewed" if review_count >= 1000 else "well_reviewed"
 
-    if rating and review_count:
-        if rating >= 4.0 and review_count >= 100:
-            indicators["overall_quality"] = "excellent"
-            indicators["recommended"] = True
+def get_quality_indicators(rating: Optional[float], review_count: Optional[int], in_stock: bool) -> Dict:
+    """Analyze product quality based on rating and reviews."""
+    has_rating = rating is not None
+    has_reviews = review_count is not None
+    recommended = has_rating and has_reviews and rating >= 4.0 and review_count >= 100
 
-    return indicators
+    return {
+        "overall_quality": "excellent" if recommended else "unknown",
+        "rating_score": _RATING_SCORES[(rating >= 4.0) + (rating >= 4.5)] if has_rating else "N/A",
+        "review_score": _REVIEW_SCORES[review_count >= 1000] if has_reviews else "N/A",
+        "stock_status": _STOCK_STATUS[bool(in_stock)],
+        "recommended": recommended
+    }
@@ -0,0 +1,109 @@
+# app/batching.py
+# Background flusher that turns many small writes into batched ones
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchFlusher:
+    """
+    Buffer items and hand them to a sync writer in batches.
+
+    While running, submit() only queues the item; a background task collects
+    up to batch_size items, at most interval seconds after the first one of a
+    batch arrives, and runs write(batch) on a worker thread. Between app
+    startup and shutdown callers can therefore skip their own round-trip per
+    item; outside that window submit() returns False and the caller writes
+    directly.
+
+    Submitted items have already been reported as saved, so a failed batch
+    is retried once and then written item by item: one bad row (or a
+    transient error) costs at most that row, not the whole batch. write()
+    must be all-or-nothing for the retry to be safe.
+    """
+
+    def __init__(self, write: Callable[[List[Any]], bool], batch_size: int, interval: float):
+        """
+        Args:
+            write: Persists one batch, returning False (or raising) on
+                   failure; runs on a worker thread
+            batch_size: Maximum items per batch
+            interval: Seconds to wait for a batch to fill before writing it
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, item: Any) -> bool:
+        """Queue an item for the next batch; False if the flusher is not running."""
+        if self._loop is None:
+            return False
+        # Thread-safe: callers may be on the event loop or a worker thread
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        return True
+
+    def start(self) -> None:
+        """Start the background task on the running event loop."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write any queued items and stop the background task."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._queue = self._loop = self._task = None
+
+    async def _run(self) -> None:
+        # A None item flushes what is pending and stops the loop
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await asyncio.to_thread(self._write_with_fallback, batch)
+
+    def _try_write(self, batch: List[Any]) -> bool:
+        try:
+            return self.write(batch)
+        except Exception as e:
+            logger.error(f"Failed to write batch of {len(batch)}: {str(e)}")
+            return False
+
+    def _write_with_fallback(self, batch: List[Any]) -> None:
+        if self._try_write(batch) or self._try_write(batch):
+            return
+        if len(batch) > 1:
+            logger.warning(f"Batch of {len(batch)} failed twice, writing items one at a time")
+            batch = [item for item in batch if not self._try_write([item])]
+        if batch:
+            logger.error(f"Dropped {len(batch)} items that could not be written: {batch}")
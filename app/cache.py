@@ -0,0 +1,346 @@
+# app/cache.py
+# Redis cache helpers shared by the service layer
+
+import hashlib
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, Optional, Union
+
+import orjson
+import redis
+import redis.asyncio
+
+from app.config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# Redis Client Initialization
+# ============================================
+
+# Initialize Redis client. Caching is optional: when REDIS_URL is unset or the
+# server is unreachable every helper below degrades to a cache miss / no-op.
+redis_client: Optional[redis.Redis] = None
+
+if REDIS_URL:
+    try:
+        redis_client = redis.Redis.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+        logger.info("Redis client initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize Redis client: {str(e)}")
+        redis_client = None
+else:
+    logger.info("REDIS_URL not set - caching disabled")
+
+# Async client for binary payloads (e.g. proxied images) awaited on the event
+# loop. Responses are left as bytes; it connects lazily on first use.
+async_redis_client: Optional[redis.asyncio.Redis] = None
+
+if REDIS_URL:
+    try:
+        async_redis_client = redis.asyncio.Redis.from_url(
+            REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+    except Exception as e:
+        logger.error(f"Failed to initialize async Redis client: {str(e)}")
+        async_redis_client = None
+
+
+# ============================================
+# Key Helpers
+# ============================================
+
+def hash_key(params: Any) -> str:
+    """
+    Build a short, stable hash for a JSON-serializable set of parameters.
+
+    Args:
+        params: Any JSON-serializable value (dict, list, tuple, ...)
+
+    Returns:
+        16-character hex digest
+    """
+    raw = orjson.dumps(params, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def get_namespace_version(namespace: str) -> int:
+    """
+    Get the current version counter for a cache namespace.
+
+    Keys are built as "{namespace}:v{version}:..." so bumping the counter
+    invalidates every key in the namespace in O(1) without a SCAN.
+
+    Args:
+        namespace: Namespace name (e.g. "products")
+
+    Returns:
+        Current version (0 if unset or Redis is unavailable)
+    """
+    if redis_client is None:
+        return 0
+    try:
+        return int(redis_client.get(f"{namespace}:ver") or 0)
+    except Exception as e:
+        logger.warning(f"Cache version lookup failed for {namespace}: {str(e)}")
+        return 0
+
+
+def bump_namespace_version(namespace: str) -> None:
+    """
+    Invalidate every key in a namespace by incrementing its version counter.
+
+    Args:
+        namespace: Namespace name (e.g. "products")
+    """
+    if redis_client is None:
+        return
+    try:
+        redis_client.incr(f"{namespace}:ver")
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for {namespace}: {str(e)}")
+
+
+async def async_get_namespace_versions(*namespaces: str) -> List[int]:
+    """
+    Async counterpart of get_namespace_version() for several namespaces in
+    one MGET round-trip.
+
+    Args:
+        namespaces: Namespace names
+
+    Returns:
+        Current versions in the same order (0 if unset or Redis is unavailable)
+    """
+    if async_redis_client is None or not namespaces:
+        return [0] * len(namespaces)
+    try:
+        values = await async_redis_client.mget([f"{namespace}:ver" for namespace in namespaces])
+    except Exception as e:
+        logger.warning(f"Cache version lookup failed for {namespaces}: {str(e)}")
+        return [0] * len(namespaces)
+    return [int(value or 0) for value in values]
+
+
+async def async_bump_namespace_version(namespace: str) -> None:
+    """Async counterpart of bump_namespace_version()."""
+    if async_redis_client is None:
+        return
+    try:
+        await async_redis_client.incr(f"{namespace}:ver")
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for {namespace}: {str(e)}")
+
+
+# ============================================
+# Get / Set
+# ============================================
+
+def cache_get(key: str) -> Optional[str]:
+    """
+    Get a raw string value from the cache.
+
+    Args:
+        key: Cache key
+
+    Returns:
+        Cached string, or None on miss / error
+    """
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Cache get failed for {key}: {str(e)}")
+        return None
+
+
+def cache_set(key: str, value: Union[str, bytes], ttl: int) -> None:
+    """
+    Store a raw string value in the cache.
+
+    Args:
+        key: Cache key
+        value: String (or UTF-8 bytes) to store
+        ttl: Time to live in seconds
+    """
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, ttl, value)
+    except Exception as e:
+        logger.warning(f"Cache set failed for {key}: {str(e)}")
+
+
+def cache_get_json(key: str) -> Optional[Any]:
+    """
+    Get a JSON-decoded value from the cache.
+
+    Args:
+        key: Cache key
+
+    Returns:
+        Decoded value, or None on miss / error
+    """
+    raw = cache_get(key)
+    if raw is None:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+
+def cache_set_json(key: str, value: Any, ttl: int) -> None:
+    """
+    JSON-encode a value and store it in the cache.
+
+    Args:
+        key: Cache key
+        value: JSON-serializable value
+        ttl: Time to live in seconds
+    """
+    cache_set(key, orjson.dumps(value, default=str), ttl)
+
+
+def cache_delete(*keys: str) -> None:
+    """
+    Delete one or more keys from the cache.
+
+    Args:
+        keys: Cache keys to delete
+    """
+    if redis_client is None or not keys:
+        return
+    try:
+        redis_client.delete(*keys)
+    except Exception as e:
+        logger.warning(f"Cache delete failed for {keys}: {str(e)}")
+
+
+async def async_cache_get_bytes(key: str) -> Optional[bytes]:
+    """
+    Get a raw bytes value from the cache without blocking the event loop.
+
+    Args:
+        key: Cache key
+
+    Returns:
+        Cached bytes, or None on miss / error
+    """
+    if async_redis_client is None:
+        return None
+    try:
+        return await async_redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Cache get failed for {key}: {str(e)}")
+        return None
+
+
+async def async_cache_set_bytes(key: str, value: Union[str, bytes], ttl: int) -> None:
+    """
+    Store a raw bytes value in the cache without blocking the event loop.
+
+    Args:
+        key: Cache key
+        value: Bytes (or a string, stored UTF-8 encoded)
+        ttl: Time to live in seconds
+    """
+    if async_redis_client is None:
+        return
+    try:
+        await async_redis_client.setex(key, ttl, value)
+    except Exception as e:
+        logger.warning(f"Cache set failed for {key}: {str(e)}")
+
+
+async def async_cache_get_json(key: str) -> Optional[Any]:
+    """Async counterpart of cache_get_json()."""
+    raw = await async_cache_get_bytes(key)
+    if raw is None:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+
+async def async_cache_set_json(key: str, value: Any, ttl: int) -> None:
+    """Async counterpart of cache_set_json()."""
+    await async_cache_set_bytes(key, orjson.dumps(value, default=str), ttl)
+
+
+async def close_async_client() -> None:
+    """Release the async client's pooled connections on shutdown."""
+    if async_redis_client is not None:
+        await async_redis_client.aclose()
+
+
+# ============================================
+# Memoization
+# ============================================
+
+# "HIT" / "MISS" for the most recent memoized call in the current request
+# context, so endpoints can surface it as an X-Cache response header.
+cache_status: ContextVar[str] = ContextVar("cache_status", default="MISS")
+
+
+def _normalize_arg(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+def redis_memoize(
+    prefix: str,
+    ttl: int = 86400,
+    serialize: Callable[[Any], Union[str, bytes]] = orjson.dumps,
+    deserialize: Callable[[bytes], Any] = orjson.loads,
+):
+    """
+    Cache the result of an async function in Redis.
+
+    The key is "{prefix}:{hash}" where the hash covers all arguments after
+    lowercasing and collapsing whitespace in string values, so trivially
+    different inputs share an entry. Redis is reached through the async
+    client, so lookups never block the event loop.
+
+    Args:
+        prefix: Key prefix for this function
+        ttl: Time to live in seconds (default: 1 day)
+        serialize: Converts the result to a string for storage
+        deserialize: Converts the stored bytes back into a result
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            normalized = {
+                "args": [_normalize_arg(a) for a in args],
+                "kwargs": {k: _normalize_arg(v) for k, v in kwargs.items()},
+            }
+            key = f"{prefix}:{hash_key(normalized)}"
+
+            cached = await async_cache_get_bytes(key)
+            if cached is not None:
+                try:
+                    result = deserialize(cached)
+                    cache_status.set("HIT")
+                    return result
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable cache entry {key}: {str(e)}")
+
+            cache_status.set("MISS")
+            result = await func(*args, **kwargs)
+            await async_cache_set_bytes(key, serialize(result), ttl)
+            return result
+
+        return wrapper
+    return decorator
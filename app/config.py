@@ -0,0 +1,18 @@
+# app/config.py
+# Environment configuration — .env is read exactly once, here
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ============================================
+# Shared credentials / endpoints
+# ============================================
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # Service role key for backend
+
+REDIS_URL = os.getenv("REDIS_URL")
@@ -1,13 +1,11 @@
 # app/database.py
 # Supabase database client and utilities
 
-import os
 from typing import Optional
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from supabase import create_client, acreate_client, Client, AsyncClient
 import logging
 
-load_dotenv()
+from app.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +13,7 @@ logger = logging.getLogger(__name__)
 # Supabase Client Initialization
 # ============================================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # Use service role key for backend
+SUPABASE_KEY = SUPABASE_SERVICE_KEY
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     logger.warning("Supabase credentials not found. Database operations will fail.")
@@ -51,20 +48,45 @@ def get_supabase() -> Client:
     return supabase
 
 
-def get_db():
+# Async client for endpoints that await their queries. Built lazily because
+# acreate_client is a coroutine and must run inside the event loop.
+async_supabase: Optional[AsyncClient] = None
+
+
+async def get_async_supabase() -> AsyncClient:
+    """
+    Get the shared async Supabase client, creating it on first use.
+
+    Returns:
+        AsyncClient: Async Supabase client instance
+
+    Raises:
+        RuntimeError: If Supabase credentials are missing
+    """
+    global async_supabase
+    if async_supabase is None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError(
+                "Supabase client not initialized. "
+                "Please check SUPABASE_URL and SUPABASE_SERVICE_KEY environment variables."
+            )
+        async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        logger.info("Async Supabase client initialized successfully")
+    return async_supabase
+
+
+async def get_db():
     """
     FastAPI dependency for database access.
     Returns the Supabase client for use in route handlers.
 
+    Declared async so FastAPI resolves it on the event loop instead of
+    hopping to the threadpool on every request.
+
     Yields:
         Client: Supabase client instance
     """
-    try:
-        client = get_supabase()
-        yield client
-    except Exception as e:
-        logger.error(f"Error getting database client: {str(e)}")
-        raise
+    yield get_supabase()
 
 
 # ============================================
@@ -118,13 +140,8 @@ def init_db():
 
 
 # ============================================
-# Legacy Compatibility (for migration)
+# Table Names
 # ============================================
-# These are kept for backward compatibility during migration
-# Remove after full migration is complete
-
-SessionLocal = None  # No longer used with Supabase
-Base = None  # No longer used with Supabase
 
 # Table name constants for consistency
 TABLE_USER_PREFERENCES = "user_preferences"
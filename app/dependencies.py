@@ -8,7 +8,7 @@ from datetime import datetime
 from app.database import get_db
 from app.rate_limiter import (
     get_client_ip,
-    check_rate_limit,
+    async_check_rate_limit,
     HOURLY_TOKEN_LIMIT
 )
 import logging
@@ -31,7 +31,7 @@ async def check_rate_limit_dependency(
     """
     try:
         ip_address = get_client_ip(request)
-        is_allowed, tokens_used, reset_time = check_rate_limit(client, ip_address)
+        is_allowed, tokens_used, reset_time = await async_check_rate_limit(client, ip_address)
 
         if not is_allowed:
             reset_time_str = reset_time.isoformat()
@@ -1,9 +1,15 @@
 #embed_gifts.py
+import io
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, BadRequestError
 
 # Load env vars
 load_dotenv(r"C:\Users\camry\PycharmProjects\PythonProject\gift-ai-backend\.env")
@@ -11,11 +17,23 @@ load_dotenv(r"C:\Users\camry\PycharmProjects\PythonProject\gift-ai-backend\.env"
 if not os.getenv("OPENAI_API_KEY"):
     raise RuntimeError("OPENAI_API_KEY not found")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The client retries rate-limit / transient errors with exponential backoff
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=5)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Inputs per embeddings request (the API accepts up to 2048 per call)
+BATCH_SIZE = 256
+
+# Embedding requests kept in flight at once by the --sync path
+SYNC_CONCURRENCY = 16
+
+# Seconds between Batch API status checks
+BATCH_POLL_INTERVAL = 30
+
 
 def build_embedding_text(gift):
     return f"""
@@ -28,25 +46,119 @@ Personality traits: {", ".join(gift['personality_traits'])}.
 """
 
 
+# Words kept in description_short, the prompt-sized description stored with
+# each gift so the recommender never has to send the full text to the LLM
+DESCRIPTION_SHORT_WORDS = 40
+
 with open(DATA_DIR / "gifts.json", "r", encoding="utf-8") as f:
     gifts = json.load(f)
 
-embedded = []
-
 for gift in gifts:
-    text = build_embedding_text(gift)
-    embedding = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    ).data[0].embedding
-
-    embedded.append({
-        "id": gift["id"],
-        "embedding": embedding,
-        "metadata": gift
-    })
-
-with open(DATA_DIR / "gifts_embedded.json", "w", encoding="utf-8") as f:
-    json.dump(embedded, f, indent=2)
+    gift["description_short"] = " ".join(gift["description"].split()[:DESCRIPTION_SHORT_WORDS])
+
+def embed_texts(texts):
+    """Embed a list of texts in one request, splitting it in half if the API
+    rejects it (e.g. the batch exceeds the per-request token limit)."""
+    try:
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts
+        )
+    except BadRequestError:
+        if len(texts) == 1:
+            raise
+        mid = len(texts) // 2
+        return embed_texts(texts[:mid]) + embed_texts(texts[mid:])
+
+    # Results come back in input order; sort by index to be safe
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+def embed_gifts_sync(gifts):
+    """Embed gifts with the synchronous endpoint, BATCH_SIZE inputs per call
+    and up to SYNC_CONCURRENCY calls in flight."""
+    texts = [build_embedding_text(gift) for gift in gifts]
+    starts = range(0, len(texts), BATCH_SIZE)
+
+    with ThreadPoolExecutor(max_workers=SYNC_CONCURRENCY) as pool:
+        # map() preserves order, so batch results line up with gifts
+        batches = pool.map(lambda start: embed_texts(texts[start:start + BATCH_SIZE]), starts)
+        embeddings = [embedding for batch in batches for embedding in batch]
+
+    print(f"Embedded {len(embeddings)}/{len(gifts)} gifts")
+    return [
+        {"id": gift["id"], "embedding": embedding, "metadata": gift}
+        for gift, embedding in zip(gifts, embeddings)
+    ]
+
+
+def embed_gifts_batch(gifts):
+    """
+    Embed gifts through the Batch API (half the price of the synchronous
+    endpoint, with separate rate limits). Blocks until the job finishes,
+    which can take up to the 24h completion window.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": str(gift["id"]),
+            "method": "POST",
+            "url": "/v1/embeddings",
+            "body": {"model": EMBEDDING_MODEL, "input": build_embedding_text(gift)}
+        })
+        for gift in gifts
+    ]
+    batch_file = client.files.create(
+        file=("gifts_batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/embeddings",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} ({len(gifts)} gifts)")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total})")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    embeddings = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") == 200:
+            embeddings[result["custom_id"]] = response["body"]["data"][0]["embedding"]
+
+    missing = [gift["id"] for gift in gifts if str(gift["id"]) not in embeddings]
+    if missing:
+        print(f"Warning: {len(missing)} gifts failed to embed: {missing[:10]}")
+
+    return [
+        {"id": gift["id"], "embedding": embeddings[str(gift["id"])], "metadata": gift}
+        for gift in gifts
+        if str(gift["id"]) in embeddings
+    ]
+
+
+# Batch API by default; pass --sync for an immediate (full-price) run
+if "--sync" in sys.argv:
+    embedded = embed_gifts_sync(gifts)
+else:
+    embedded = embed_gifts_batch(gifts)
+
+# Vectors go in a float32 matrix (row i <-> gifts_meta.json[i]) that
+# consumers can np.load(..., mmap_mode="r") instead of parsing JSON floats
+matrix = np.asarray([item["embedding"] for item in embedded], dtype=np.float32)
+np.save(DATA_DIR / "gifts_embedded.npy", matrix)
+
+# Compact (no indent) — this file is read by scripts, not people
+(DATA_DIR / "gifts_meta.json").write_bytes(
+    orjson.dumps([{"id": item["id"], "metadata": item["metadata"]} for item in embedded])
+)
 
 print(f"Embedded {len(embedded)} gifts")
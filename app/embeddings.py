@@ -1,26 +1,40 @@
 # app/embeddings.py
 
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
 from typing import List, Dict
+import base64
 import logging
 import json
 from functools import lru_cache
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import numpy as np
+
+from app.cache import cache_get, cache_set, hash_key
+from app.openai_client import client
+
 logger = logging.getLogger(__name__)
 
+# Embeddings are also shared across workers in Redis as base64 float32 bytes
+# (~8 KB each) under "emb:{hash}"; the same text always embeds the same way
+EMBEDDING_REDIS_TTL = 86400
+
 
 @lru_cache(maxsize=500)
 def _embedding_cache(text: str) -> tuple:
     """Internal cached embedding call — returns tuple so lru_cache can store it."""
+    key = f"emb:{hash_key(text)}"
+    cached = cache_get(key)
+    if cached is not None:
+        logger.info("Embedding Redis HIT query=%.60s", text)
+        return tuple(np.frombuffer(base64.b64decode(cached), dtype=np.float32).tolist())
+
     response = client.embeddings.create(
         model="text-embedding-3-small",
         input=text
     )
-    return tuple(response.data[0].embedding)
+    embedding = response.data[0].embedding
+    packed = base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+    cache_set(key, packed, EMBEDDING_REDIS_TTL)
+    return tuple(embedding)
 
 
 def generate_embedding(text: str) -> List[float]:
@@ -1,18 +1,22 @@
-from openai import OpenAI
+import asyncio
 import os
 import time
 import textwrap
 import re
-from concurrent.futures import ThreadPoolExecutor
-from dotenv import load_dotenv
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import json
 import logging
+from functools import lru_cache
+
+from app.cache import hash_key, async_cache_get_bytes, async_cache_set_bytes
+from app.openai_client import async_client, client
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 logger = logging.getLogger(__name__)
 
+# The intro and reasons depend only on the prompt, so parsed replies are
+# shared across workers through Redis under "llmresp:{hash(system + user prompt)}"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+
 
 # =============================================================================
 # GIFT INTELLIGENCE — OCCASION x STAGE
@@ -72,6 +76,11 @@ OCCASION_PITFALLS = {
 }
 
 
+# The prompt helpers below are pure functions of a handful of strings that
+# repeat across requests (catalog names/descriptions, occasion x stage), so
+# their results are memoized.
+
+@lru_cache(maxsize=4096)
 def _sanitize_for_prompt(text: str) -> str:
     """
     Strip characters that cause JSON parse errors when injected into prompts.
@@ -88,6 +97,12 @@ def _sanitize_for_prompt(text: str) -> str:
     return text.strip()
 
 
+@lru_cache(maxsize=4096)
+def _short_description(text: str) -> str:
+    """Sanitized description truncated to ~100 chars for the gift list."""
+    return _sanitize_for_prompt(textwrap.shorten(text, width=100, placeholder="..."))
+
+
 def _normalize_jsonb_to_list(value) -> List[str]:
     """Convert JSONB field to Python list of strings safely."""
     if value is None:
@@ -104,10 +119,11 @@ def _normalize_jsonb_to_list(value) -> List[str]:
     return []
 
 
+@lru_cache(maxsize=1024)
 def _build_gift_intelligence_block(
     occasion: Optional[str],
     stage: Optional[str],
-    vibe: Optional[List[str]],
+    vibe: Tuple[str, ...],
     confidence: Optional[str],
 ) -> str:
     lines = ["GIFT INTELLIGENCE:"]
@@ -137,6 +153,7 @@ def _build_gift_intelligence_block(
     return "\n".join(lines)
 
 
+@lru_cache(maxsize=1024)
 def _build_reason_instruction(
     target: str,
     occasion: Optional[str],
@@ -164,6 +181,82 @@ def _build_reason_instruction(
     return f"Explain {angle}. {lens}".strip()
 
 
+# =============================================================================
+# PROMPT TEMPLATES
+# =============================================================================
+
+# Identical for every request, so the provider can reuse its cached prompt
+# prefix; everything request-specific goes in the user message (_CONTEXT_TEMPLATE)
+_SYSTEM_PROMPT = (
+    "You are an elite gift advisor helping men feel confident about the gift they're about to buy.\n"
+    "Your job is NOT to describe the product or invent things about the recipient. "
+    "Your job is to REASSURE the buyer — explain why this is the right call given "
+    "the occasion, the stage of the relationship, and what he actually knows about her.\n\n"
+    "RULES:\n"
+    "- You are writing for the BUYER, not about the recipient. Reassure him his choice is right.\n"
+    "- ONLY reference interests explicitly listed in KNOWN INTERESTS. Never invent traits, values, or preferences.\n"
+    "- Anchor every reason in one or more of: (1) occasion logic, (2) relationship stage logic, (3) her known interests. Use only what you actually have.\n"
+    "- If no interests are known, rely on occasion + stage alone. Do not fabricate specificity.\n"
+    "- 2 sentences max per reason. Confident, warm, direct.\n"
+    "- No phrases like 'perfect gift', 'she will love it', 'timeless', 'cherished', 'lasting elegance'.\n\n"
+    "Return valid JSON only. No markdown."
+)
+
+_CONTEXT_TEMPLATE = (
+    "TARGET: {target} | OCCASION: {occasion} | "
+    "STAGE: {stage} | TIMING: {urgency} | "
+    "BUDGET: {budget}\n"
+    "KNOWN INTERESTS: {interests}\n"
+    "{specific_interests}"
+    "\n{gift_intelligence}\n\n"
+    "NAME RULE — THIS IS MANDATORY:\n"
+    "The recipient's name is '{target}'. You MUST use this name at least once in every single reason. "
+    "Do not write a reason that only uses 'she' or 'her' without ever saying '{target}'. "
+    "Example of correct usage: 'Valentine's Day at this stage calls for something warm — "
+    "this lands in exactly that space for {target}.'\n\n"
+    "{interest_signal_block}"
+    "BAD: This speaks to {target}'s deep appreciation for timeless elegance and lasting beauty.\n"
+    "BAD: A reason that never mentions {target} by name — always use the name at least once.\n\n"
+)
+
+_SPECIFIC_INTERESTS_LINE = (
+    "SPECIFIC INTERESTS (use these verbatim in personalized copy — e.g. 'Her love of "
+    "{first} makes this a perfect fit'): {all}\n"
+)
+
+# Structured output: the model can only emit this exact shape, compactly
+_GIFT_REPLY_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "gift_reply",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "intro": {"type": "string"},
+                "gifts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "reason": {"type": "string"},
+                        },
+                        "required": ["name", "reason"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["intro", "gifts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_GIFT_LINE = "{i}. {name} (${price}) | vibe: {vibe} | {desc}"
+_GIFT_LINE_WITH_MATCH = "{i}. {name} (${price}) | vibe: {vibe} | interest_match: {match} | {desc}"
+
+
 # =============================================================================
 # HELPERS
 # =============================================================================
@@ -226,29 +319,117 @@ def _get_urgency_label(days: Optional[int]) -> str:
     return "plenty of time"
 
 
-def _call_llm(
+class _StreamingReasonParser:
+    """
+    Incrementally pick complete values out of a streamed
+    {"intro": "...", "gifts": [{"name": ..., "reason": ...}, ...]} reply.
+
+    Each feed() returns the events that became complete with that chunk:
+    {"type": "intro", "intro": str} once, then one
+    {"type": "reason", "name": str, "reason": str} per finished gift.
+    """
+
+    _INTRO_RE = re.compile(r'"intro"\s*:\s*')
+    _GIFTS_RE = re.compile(r'"gifts"\s*:\s*\[')
+
+    def __init__(self):
+        self._buffer = ""
+        self._decoder = json.JSONDecoder()
+        self._intro_done = False
+        self._gift_pos: Optional[int] = None  # Where the next gift object may start
+
+    def feed(self, delta: str) -> List[Dict]:
+        self._buffer += delta
+        buf = self._buffer
+        events = []
+
+        if not self._intro_done:
+            match = self._INTRO_RE.search(buf)
+            if match:
+                try:
+                    intro, _ = self._decoder.raw_decode(buf, match.end())
+                except json.JSONDecodeError:
+                    pass  # String not closed yet
+                else:
+                    self._intro_done = True
+                    events.append({"type": "intro", "intro": intro})
+
+        if self._gift_pos is None:
+            match = self._GIFTS_RE.search(buf)
+            if match:
+                self._gift_pos = match.end()
+
+        while self._gift_pos is not None:
+            pos = self._gift_pos
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf) or buf[pos] != "{":
+                break
+            try:
+                gift, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # Object not closed yet
+            self._gift_pos = end
+            events.append({"type": "reason", "name": gift.get("name", ""), "reason": gift.get("reason", "")})
+
+        return events
+
+
+async def _call_llm(
     system_prompt: str,
     user_prompt: str,
     max_tokens: int,
+    on_event: Optional[Callable[[Dict], None]] = None,
 ) -> Tuple[Optional[dict], int]:
     """
     Single LLM call. Returns (parsed_dict_or_None, tokens_used).
     Returns None if the response was truncated (finish_reason=length)
     or if the JSON failed to parse.
+
+    When on_event is given the completion is streamed, and on_event is called
+    with the intro and each gift reason as soon as it has been generated.
     """
-    response = client.chat.completions.create(
+    request = dict(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user",   "content": user_prompt},
         ],
-        response_format={"type": "json_object"},
+        response_format=_GIFT_REPLY_FORMAT,
         temperature=0.80,
         max_tokens=max_tokens,
     )
-    raw         = response.choices[0].message.content.strip()
-    tokens_used = response.usage.total_tokens if response.usage else 0
-    finish      = response.choices[0].finish_reason
+
+    if on_event is None:
+        response    = await async_client.chat.completions.create(**request)
+        raw         = response.choices[0].message.content.strip()
+        usage       = response.usage
+        finish      = response.choices[0].finish_reason
+    else:
+        stream = await async_client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+        parser      = _StreamingReasonParser()
+        parts       = []
+        usage       = None
+        finish      = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage  # Final chunk, no choices
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish = choice.finish_reason or finish
+            if choice.delta.content:
+                parts.append(choice.delta.content)
+                for event in parser.feed(choice.delta.content):
+                    on_event(event)
+        raw = "".join(parts).strip()
+
+    tokens_used = usage.total_tokens if usage else 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details and details.cached_tokens:
+        logger.info(f"LLM prompt cache: {details.cached_tokens}/{usage.prompt_tokens} prompt tokens cached")
 
     if finish == "length":
         logger.warning(
@@ -269,13 +450,23 @@ def _call_llm(
 # MAIN
 # =============================================================================
 
-def generate_gift_response(
+async def generate_gift_response(
     query: str,
     gifts: List[Dict],
     preferences: Optional[Dict] = None,
     partner_context: Optional[Dict] = None,
     session_context: Optional[Dict] = None,
+    on_event: Optional[Callable[[Dict], None]] = None,
 ) -> tuple[Dict, int]:
+    """
+    Write the intro and per-gift reasons for a recommendation.
+
+    If on_event is given, the intro and each reason are also passed to it as
+    they stream in from the LLM (see _StreamingReasonParser); the returned
+    response remains the authoritative, fully enriched result. If the first
+    attempt is truncated, {"type": "reset"} is emitted before the retry
+    streams its own intro and reasons, so consumers drop what they showed.
+    """
 
     if not gifts:
         return {"intro": "Couldn't find good matches — try adjusting filters.", "gifts": []}, 0
@@ -321,7 +512,7 @@ def generate_gift_response(
         target = "her"
 
     # --- Intelligence blocks ---
-    gift_intelligence  = _build_gift_intelligence_block(occasion, relationship, vibe, confidence)
+    gift_intelligence  = _build_gift_intelligence_block(occasion, relationship, tuple(vibe), confidence)
     reason_instruction = _build_reason_instruction(target, occasion, relationship)
 
     # --- Determine whether interests are actually available ---
@@ -355,9 +546,7 @@ def generate_gift_response(
         raw_name  = g.get("name", "") or ""
         raw_desc  = g.get("description", "") or ""
         name      = _sanitize_for_prompt(raw_name)
-        desc      = _sanitize_for_prompt(
-                        textwrap.shorten(raw_desc, width=100, placeholder="...")
-                    )
+        desc      = _short_description(g.get("description_short") or raw_desc)
         price     = g.get("price", 0)
         vibe_tags = ", ".join(g.get("vibe") or [])
 
@@ -373,13 +562,11 @@ def generate_gift_response(
             text_match = any(kw in text_blob for kw in niche_kw_set)
 
             interest_match = "YES" if (tag_match or text_match) else "NO"
-            gift_lines.append(
-                f"{i}. {name} (${price}) | vibe: {vibe_tags} | interest_match: {interest_match} | {desc}"
-            )
+            gift_lines.append(_GIFT_LINE_WITH_MATCH.format(
+                i=i, name=name, price=price, vibe=vibe_tags, match=interest_match, desc=desc
+            ))
         else:
-            gift_lines.append(
-                f"{i}. {name} (${price}) | vibe: {vibe_tags} | {desc}"
-            )
+            gift_lines.append(_GIFT_LINE.format(i=i, name=name, price=price, vibe=vibe_tags, desc=desc))
 
     # --- Build interest signal instructions for the prompt ---
     # Only injected when interests are present. Completely omitted otherwise
@@ -420,63 +607,67 @@ def generate_gift_response(
     # --- Safe interests preview for inline use in the GOOD example ---
     interests_preview = all_interests[0] if all_interests else None
 
-    system_prompt = (
-        f"You are an elite gift advisor helping men feel confident about the gift they're about to buy.\n"
-        f"Your job is NOT to describe the product or invent things about the recipient. "
-        f"Your job is to REASSURE the buyer — explain why this is the right call given "
-        f"the occasion, the stage of the relationship, and what he actually knows about her.\n\n"
-        f"TARGET: {target} | OCCASION: {occasion or 'general'} | "
-        f"STAGE: {relationship or 'unknown'} | TIMING: {urgency} | "
-        f"BUDGET: {'$' + str(budget) if budget else 'flexible'}\n"
-        f"KNOWN INTERESTS: {interests_str}\n"
-        + (
-            f"SPECIFIC INTERESTS (use these verbatim in personalized copy — e.g. 'Her love of "
-            f"{niche_keywords[0]} makes this a perfect fit'): {', '.join(niche_keywords)}\n"
+    request_context = _CONTEXT_TEMPLATE.format(
+        target=target,
+        occasion=occasion or "general",
+        stage=relationship or "unknown",
+        urgency=urgency,
+        budget="$" + str(budget) if budget else "flexible",
+        interests=interests_str,
+        specific_interests=(
+            _SPECIFIC_INTERESTS_LINE.format(first=niche_keywords[0], all=", ".join(niche_keywords))
             if niche_keywords and confidence != "lost" else ""
-        )
-        + f"\n{gift_intelligence}\n\n"
-        f"NAME RULE — THIS IS MANDATORY:\n"
-        f"The recipient's name is '{target}'. You MUST use this name at least once in every single reason. "
-        f"Do not write a reason that only uses 'she' or 'her' without ever saying '{target}'. "
-        f"Example of correct usage: 'Valentine's Day at this stage calls for something warm — "
-        f"this lands in exactly that space for {target}.'\n\n"
-        f"RULES:\n"
-        f"- You are writing for the BUYER, not about the recipient. Reassure him his choice is right.\n"
-        f"- ONLY reference interests explicitly listed in KNOWN INTERESTS. Never invent traits, values, or preferences.\n"
-        f"- Anchor every reason in one or more of: (1) occasion logic, (2) relationship stage logic, (3) her known interests. Use only what you actually have.\n"
-        f"- If no interests are known, rely on occasion + stage alone. Do not fabricate specificity.\n"
-        f"- 2 sentences max per reason. Confident, warm, direct.\n"
-        f"- No phrases like 'perfect gift', 'she will love it', 'timeless', 'cherished', 'lasting elegance'.\n\n"
-        f"{interest_signal_block}"
-        f"BAD: This speaks to {target}'s deep appreciation for timeless elegance and lasting beauty.\n"
-        f"BAD: A reason that never mentions {target} by name — always use the name at least once.\n\n"
-        f"Return valid JSON only. No markdown."
+        ),
+        gift_intelligence=gift_intelligence,
+        interest_signal_block=interest_signal_block,
     )
 
     def _make_user_prompt(lines: List[str]) -> str:
         gift_ctx = "\n".join(lines)
         return (
+            f"{request_context}"
             f"Reason for each gift — answer: {reason_instruction}\n\n"
             f"Gifts:\n{gift_ctx}\n\n"
             f"JSON format:\n"
             f'{{"intro":"one sentence for {target}","gifts":[{{"name":"<exact>","reason":"2 sentences"}}]}}'
         )
 
+    # --- Response cache ---
+    # Keyed on the exact prompt of attempt 1: it fixes the reply (the retry
+    # prompt below is derived from the same inputs)
+    user_prompt = _make_user_prompt(gift_lines)
+    response_cache_key = f"llmresp:{hash_key([_SYSTEM_PROMPT, user_prompt])}"
+
     # --- LLM call strategy ---
     parsed      = None
     tokens_used = 0
     start       = time.time()
 
-    try:
-        # Attempt 1: all gifts
-        parsed, t1 = _call_llm(system_prompt, _make_user_prompt(gift_lines), max_tokens=1400)
-        tokens_used += t1
+    cached = await async_cache_get_bytes(response_cache_key)
+    if cached is not None:
+        logger.info("Response cache HIT — skipping LLM call")
+        parsed = json.loads(cached)
 
-        # Attempt 2: if still failing, retry with top 5 gifts only
+    try:
         if parsed is None:
-            logger.warning("Retrying with top 5 gifts to reduce output size")
-            parsed, t2 = _call_llm(system_prompt, _make_user_prompt(gift_lines[:5]), max_tokens=700)
-            tokens_used += t2
+            # Attempt 1: all gifts
+            parsed, t1 = await _call_llm(
+                _SYSTEM_PROMPT, user_prompt, max_tokens=1400, on_event=on_event
+            )
+            tokens_used += t1
+
+            # Attempt 2: if still failing, retry with top 5 gifts only
+            if parsed is None:
+                logger.warning("Retrying with top 5 gifts to reduce output size")
+                if on_event is not None:
+                    on_event({"type": "reset"})
+                parsed, t2 = await _call_llm(
+                    _SYSTEM_PROMPT, _make_user_prompt(gift_lines[:5]), max_tokens=700, on_event=on_event
+                )
+                tokens_used += t2
+
+            if parsed is not None:
+                await async_cache_set_bytes(response_cache_key, json.dumps(parsed), RESPONSE_CACHE_TTL)
 
     except Exception as e:
         logger.error(f"LLM call failed: {e}")
@@ -486,6 +677,13 @@ def generate_gift_response(
 
     llm_gifts = parsed.get("gifts", []) if parsed else []
 
+    # Exact (case-insensitive) name matches resolved with one dict lookup;
+    # only gifts the LLM renamed fall through to the fuzzy scan
+    reasons_by_name: Dict[str, Optional[str]] = {}
+    for g in llm_gifts:
+        if isinstance(g, dict) and g.get("name"):
+            reasons_by_name.setdefault(g["name"].lower(), g.get("reason"))
+
     if not llm_gifts:
         logger.warning("LLM returned no gift reasons — using occasion fallbacks")
 
@@ -502,10 +700,16 @@ def generate_gift_response(
     fallback = occasion_fallbacks.get(occasion or "", "A well-matched choice given the occasion and where they are.")
 
     # --- Enrich results ---
-    def enrich_single_gift(original: Dict) -> Dict:
+    async def enrich_single_gift(original: Dict) -> Dict:
         name         = original.get("name", "")
-        reason       = _fuzzy_match_reason(name, llm_gifts) or fallback
-        display_name = original.get("display_name") or generate_display_name(name, original.get("description", ""))
+        reason       = (
+            reasons_by_name.get(name.lower())
+            or _fuzzy_match_reason(name, llm_gifts)
+            or fallback
+        )
+        display_name = original.get("display_name") or await asyncio.to_thread(
+            generate_display_name, name, original.get("description", "")
+        )
 
         return {
             "name":             name,
@@ -524,8 +728,7 @@ def generate_gift_response(
         }
 
     start_enrich = time.time()
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        enriched = list(executor.map(enrich_single_gift, gifts))
+    enriched = list(await asyncio.gather(*(enrich_single_gift(g) for g in gifts)))
     logger.info(f"Enrichment {(time.time() - start_enrich)*1000:.0f}ms")
 
     return {"intro": parsed.get("intro", "") if parsed else "", "gifts": enriched}, tokens_used
\ No newline at end of file
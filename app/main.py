@@ -2,21 +2,32 @@
 
 import os
 import asyncio
+import hashlib
+import hmac
 import time
-from typing import Optional, List
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Tuple
 from pathlib import Path
+from urllib.parse import urlsplit
 
-from fastapi import FastAPI, Header, HTTPException, Depends, Response, Query
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Depends, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import json
 import httpx
+import orjson
+import anyio.to_thread
+from cachetools import TTLCache
 import logging
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 from fastapi.exceptions import RequestValidationError
+from starlette.background import BackgroundTask
 from starlette.requests import Request
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
@@ -32,15 +43,28 @@ from app.schemas import (
     GiftItem,
 )
 from app.persistence import (
-    save_preferences,
-    get_preferences,
-    save_feedback,
-    get_inferred,
+    async_save_preferences,
+    async_save_feedback,
+    async_get_user_context,
+    feedback_version_namespace,
+    start_write_flusher,
+    stop_write_flusher,
 )
 from app.database import init_db, get_db
 from app.dependencies import check_rate_limit_dependency
-from app.rate_limiter import record_token_usage
+from app.rate_limiter import async_record_token_usage, start_usage_flusher, stop_usage_flusher
 from app.admin_api import router as admin_router, verify_admin
+from app.ai_categorization import categorization_cache
+from app.cache import (
+    hash_key,
+    async_cache_get_bytes,
+    async_cache_set_bytes,
+    async_get_namespace_versions,
+    close_async_client as close_redis_client,
+)
+from app.admin_products import PRODUCTS_CACHE_NAMESPACE, invalidate_product_cache
+from app.openai_client import async_client as openai_async_client, close_clients as close_openai_clients
+from app.amazon_scraper import close_http_client as close_scraper_client
 from supabase import Client
 
 # Import routers
@@ -73,7 +97,49 @@ if _sentry_dsn:
 # APP SETUP
 # =============================================================================
 
-app = FastAPI(title="Gift AI Backend", version="2.0.0")
+# Worker threads available to sync endpoints (AnyIO default is 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "200"))
+
+
+async def _prewarm_openai() -> None:
+    """Open the pooled OpenAI connection before the first request needs it."""
+    try:
+        await openai_async_client.models.list()
+    except Exception as e:
+        logger.warning("OpenAI pre-warm failed: %s" % str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync (`def`) endpoints run on AnyIO's worker threads; the default of 40
+    # is too low when most of them wait on Supabase round-trips
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    # Connect to Supabase and OpenAI concurrently, before traffic arrives
+    await asyncio.gather(asyncio.to_thread(init_db), _prewarm_openai())
+    start_usage_flusher()
+    start_write_flusher()
+    image_cache_sweeper = asyncio.create_task(_sweep_image_cache_loop())
+
+    yield
+
+    image_cache_sweeper.cancel()
+    await stop_usage_flusher()
+    await stop_write_flusher()
+    categorization_cache.save()
+    await close_scraper_client()
+    await close_openai_clients()
+    await _image_http.aclose()
+    await close_redis_client()
+
+
+# Route return values are encoded with orjson rather than the stdlib json
+app = FastAPI(
+    title="Gift AI Backend",
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # Mount static files
 try:
@@ -90,23 +156,16 @@ app.include_router(user_profile_router)
 app.include_router(cron_router)
 
 
-# Startup
-@app.on_event("startup")
-def startup():
-    init_db()
-
-
 # CORS
+# Auth travels in headers, not cookies, so credentials are not needed; with
+# allow_credentials off a wildcard origin is sent as a constant header instead
+# of echoing and Vary-ing on every request's Origin
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "https://web-production-314d8.up.railway.app",
-        "*",
-    ],
-    allow_credentials=True,
+    allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
 
@@ -157,9 +216,13 @@ async def generic_exception_handler(request: Request, exc: Exception):
 # API KEY PROTECTION
 # =============================================================================
 
+BACKEND_API_KEY = os.getenv("BACKEND_API_KEY")
+_BACKEND_KEY_BYTES = BACKEND_API_KEY.encode() if BACKEND_API_KEY else None
+
+
 def require_api_key(x_api_key: str = Header(None)):
-    expected_key = os.getenv("BACKEND_API_KEY")
-    if not expected_key or x_api_key != expected_key:
+    """Verify the backend API key (constant-time comparison)."""
+    if _BACKEND_KEY_BYTES is None or not x_api_key or not hmac.compare_digest(x_api_key.encode(), _BACKEND_KEY_BYTES):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
@@ -168,32 +231,309 @@ def require_api_key(x_api_key: str = Header(None)):
 # Proxies Amazon images to avoid CORS issues
 # =============================================================================
 
+# Shared client so image fetches reuse pooled (HTTP/2) connections to the
+# image CDN instead of a new TLS handshake per request
+_image_http = httpx.AsyncClient(
+    follow_redirects=True,
+    timeout=httpx.Timeout(10.0, connect=5.0),
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0),
+)
+
+_IMAGE_PROXY_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.amazon.com/",
+}
+
+# Only catalog image hosts are proxied, so the endpoint cannot be used to fetch
+# (and fill the caches with) arbitrary content
+IMAGE_PROXY_ALLOWED_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.getenv(
+        "IMAGE_PROXY_ALLOWED_HOSTS",
+        "m.media-amazon.com,images-na.ssl-images-amazon.com,"
+        "images-eu.ssl-images-amazon.com,images-fe.ssl-images-amazon.com",
+    ).split(",")
+    if host.strip()
+)
+
+
+def _is_allowed_image_url(url) -> bool:
+    parts = urlsplit(str(url))
+    return parts.scheme in ("http", "https") and (parts.hostname or "") in IMAGE_PROXY_ALLOWED_HOSTS
+
+
+_IMAGE_RESPONSE_HEADERS = {
+    "Cache-Control": "public, max-age=86400",
+    "Access-Control-Allow-Origin": "*",
+}
+
+# Origin validators that are stored with cached images and echoed to clients
+# so browsers can revalidate with If-None-Match / If-Modified-Since
+_IMAGE_VALIDATOR_HEADERS = ("ETag", "Last-Modified")
+_IMAGE_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+def _image_validators(headers) -> Dict[str, str]:
+    return {name: headers[name] for name in _IMAGE_VALIDATOR_HEADERS if headers.get(name)}
+
+
+def _image_response_headers(validators: Dict[str, str]) -> Dict[str, str]:
+    return {**_IMAGE_RESPONSE_HEADERS, **validators}
+
+
+def _not_modified(request: Request, validators: Dict[str, str]) -> bool:
+    """Whether the client's cached copy matches the validators (RFC 9110 13.2.2:
+    If-None-Match takes precedence over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = validators.get("ETag")
+        if not etag:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = validators.get("Last-Modified")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _image_not_modified_response(validators: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=_image_response_headers(validators))
+
+# Fetched images are kept on local disk, keyed by sha256(url), so repeat
+# requests for catalog images skip the upstream fetch. A periodic sweep drops
+# expired files, then the oldest ones while the directory exceeds its quota
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "/tmp/img_cache"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", "86400"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_CACHE_SWEEP_INTERVAL = int(os.getenv("IMAGE_CACHE_SWEEP_INTERVAL", "600"))
+
+# Images larger than this are proxied but not cached in any tier
+IMAGE_CACHE_MAX_ITEM_BYTES = 2_000_000
+
+# Hot images are also kept in memory, bounded by total bytes
+IMAGE_MEMORY_CACHE_BYTES = int(os.getenv("IMAGE_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+_image_memory_cache: TTLCache = TTLCache(
+    maxsize=IMAGE_MEMORY_CACHE_BYTES, ttl=IMAGE_CACHE_TTL, getsizeof=lambda entry: len(entry[0])
+)
+
+# Images up to 1 MB are shared across workers/instances through Redis, stored
+# as b"<content-type>\n<etag>\n<last-modified>\n<body>" under img:v2:<sha1(url)>
+# (header values cannot contain newlines)
+IMAGE_REDIS_MAX_ITEM_BYTES = 1_000_000
+
+
+def _image_redis_key(url: str) -> str:
+    return f"img:v2:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def _pack_image(body: bytes, content_type: str, validators: Dict[str, str]) -> bytes:
+    fields = [content_type] + [validators.get(name, "") for name in _IMAGE_VALIDATOR_HEADERS]
+    return "\n".join(fields).encode("utf-8") + b"\n" + body
+
+
+def _unpack_image(payload: bytes) -> Tuple[bytes, str, Dict[str, str]]:
+    content_type, etag, last_modified, body = payload.split(b"\n", 3)
+    values = (etag.decode("utf-8"), last_modified.decode("utf-8"))
+    validators = {name: value for name, value in zip(_IMAGE_VALIDATOR_HEADERS, values) if value}
+    return body, content_type.decode("utf-8"), validators
+
+
+def _image_cache_path(url: str) -> Path:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return IMAGE_CACHE_DIR / key[:2] / key
+
+
+def _read_cached_image_meta(path: Path) -> Optional[Tuple[str, Dict[str, str]]]:
+    """Content type and validators of a fresh cached image, or None if
+    absent/expired. The .type sidecar holds one header value per line."""
+    try:
+        if time.time() - path.stat().st_mtime > IMAGE_CACHE_TTL:
+            return None
+        content_type, *values = path.with_suffix(".type").read_text().split("\n")
+    except OSError:
+        return None
+    validators = {name: value for name, value in zip(_IMAGE_VALIDATOR_HEADERS, values) if value}
+    return content_type, validators
+
+
+def _write_cached_image_meta(path: Path, content_type: str, validators: Dict[str, str]) -> None:
+    fields = [content_type] + [validators.get(name, "") for name in _IMAGE_VALIDATOR_HEADERS]
+    path.with_suffix(".type").write_text("\n".join(fields))
+
+
+def _remove_cached_image(path: Path) -> None:
+    for file in (path, path.with_suffix(".type")):
+        try:
+            file.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("Failed to remove cached image %s: %s" % (file, str(e)))
+
+
+def _sweep_image_cache() -> None:
+    """Delete expired images and abandoned temp files, then the least recently
+    written images until the disk cache fits in IMAGE_CACHE_MAX_BYTES."""
+    now = time.time()
+    entries: List[Tuple[float, int, Path]] = []
+    total = 0
+    for file in IMAGE_CACHE_DIR.glob("*/*"):
+        if file.suffix == ".type":
+            if not file.with_suffix("").exists():
+                _remove_cached_image(file.with_suffix(""))
+            continue
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        if now - stat.st_mtime > IMAGE_CACHE_TTL:
+            _remove_cached_image(file)
+        elif file.suffix != ".tmp":
+            entries.append((stat.st_mtime, stat.st_size, file))
+            total += stat.st_size
+
+    entries.sort()
+    for _, size, file in entries:
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            break
+        _remove_cached_image(file)
+        total -= size
+
+
+async def _sweep_image_cache_loop() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(_sweep_image_cache)
+        except Exception as e:
+            logger.warning("Image cache sweep failed: %s" % str(e))
+        await asyncio.sleep(IMAGE_CACHE_SWEEP_INTERVAL)
+
+
+async def _stream_and_cache_image(
+    response: httpx.Response, url: str, path: Path, content_type: str, validators: Dict[str, str]
+):
+    """Yield the upstream body while caching it in memory, on disk and (if
+    small enough) in Redis; entries only appear once the whole body has been
+    received, the file atomically. Bodies over IMAGE_CACHE_MAX_ITEM_BYTES are
+    passed through without caching."""
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = open(tmp_path, "wb")
+    except OSError as e:
+        logger.warning("Image disk cache unavailable: %s" % str(e))
+        tmp_file = None
+
+    chunks: List[bytes] = []
+    size = 0
+    caching = True
+    complete = False
+    try:
+        async for chunk in response.aiter_bytes(65536):
+            size += len(chunk)
+            if caching and size > IMAGE_CACHE_MAX_ITEM_BYTES:
+                caching = False
+                chunks = []
+                if tmp_file:
+                    tmp_file.close()
+                    tmp_file = None
+                    try:
+                        tmp_path.unlink(missing_ok=True)
+                    except OSError as e:
+                        logger.warning("Failed to discard oversized image: %s" % str(e))
+            if caching:
+                chunks.append(chunk)
+                if tmp_file:
+                    tmp_file.write(chunk)
+            yield chunk
+        complete = True
+
+        if caching:
+            body = b"".join(chunks)
+            _image_memory_cache[url] = (body, content_type, validators)
+            if size <= IMAGE_REDIS_MAX_ITEM_BYTES:
+                payload = _pack_image(body, content_type, validators)
+                await async_cache_set_bytes(_image_redis_key(url), payload, IMAGE_CACHE_TTL)
+    finally:
+        if tmp_file:
+            tmp_file.close()
+            try:
+                if complete:
+                    _write_cached_image_meta(path, content_type, validators)
+                    os.replace(tmp_path, path)
+                else:
+                    tmp_path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Failed to cache image: %s" % str(e))
+
+
 @app.get("/proxy-image")
-async def proxy_image(url: str):
+async def proxy_image(request: Request, url: str):
     logger.info("Proxying image request for: %s" % url)
+    if not _is_allowed_image_url(url):
+        return Response(content="Image host not allowed", status_code=400)
+
+    cached = _image_memory_cache.get(url)
+    if cached is None:
+        payload = await async_cache_get_bytes(_image_redis_key(url))
+        if payload is not None:
+            cached = _unpack_image(payload)
+            _image_memory_cache[url] = cached
+    if cached is not None:
+        body, content_type, validators = cached
+        if _not_modified(request, validators):
+            return _image_not_modified_response(validators)
+        return Response(content=body, media_type=content_type, headers=_image_response_headers(validators))
+
+    cache_path = _image_cache_path(url)
+    cached_meta = await asyncio.to_thread(_read_cached_image_meta, cache_path)
+    if cached_meta:
+        cached_type, validators = cached_meta
+        if _not_modified(request, validators):
+            return _image_not_modified_response(validators)
+        return FileResponse(cache_path, media_type=cached_type, headers=_image_response_headers(validators))
+
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=10.0) as client:
-            headers = {
-                "User-Agent": "Mozilla/5.0",
-                "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-                "Referer": "https://www.amazon.com/",
-            }
-            response = await client.get(url, headers=headers)
-            if response.status_code == 200:
-                content_type = response.headers.get("content-type", "image/jpeg")
-                return Response(
-                    content=response.content,
-                    media_type=content_type,
-                    headers={
-                        "Cache-Control": "public, max-age=86400",
-                        "Access-Control-Allow-Origin": "*",
-                    },
-                )
-            else:
-                return Response(
-                    content="Failed to fetch image: %d" % response.status_code,
-                    status_code=response.status_code,
-                )
+        # Pass the client's validators through so an unchanged image costs
+        # the origin a 304 instead of the full body
+        conditional = {
+            name: request.headers[name] for name in _IMAGE_CONDITIONAL_HEADERS if request.headers.get(name)
+        }
+        headers = {**_IMAGE_PROXY_HEADERS, **conditional} if conditional else _IMAGE_PROXY_HEADERS
+
+        upstream_request = _image_http.build_request("GET", url, headers=headers)
+        response = await _image_http.send(upstream_request, stream=True)
+        if not _is_allowed_image_url(response.url):
+            # Redirected off the allowlist
+            await response.aclose()
+            return Response(content="Image host not allowed", status_code=400)
+        if response.status_code == 304:
+            await response.aclose()
+            return _image_not_modified_response(_image_validators(response.headers))
+        elif response.status_code == 200:
+            # Forward chunks as they arrive rather than buffering the image;
+            # the upstream connection is released once the body is sent
+            content_type = response.headers.get("content-type", "image/jpeg")
+            validators = _image_validators(response.headers)
+            return StreamingResponse(
+                _stream_and_cache_image(response, url, cache_path, content_type, validators),
+                media_type=content_type,
+                headers=_image_response_headers(validators),
+                background=BackgroundTask(response.aclose),
+            )
+        else:
+            await response.aclose()
+            return Response(
+                content="Failed to fetch image: %d" % response.status_code,
+                status_code=response.status_code,
+            )
     except Exception as e:
         logger.error("Error fetching image: %s" % str(e))
         return Response(content="Error: %s" % str(e), status_code=500)
@@ -204,8 +544,8 @@ async def proxy_image(url: str):
 # =============================================================================
 
 @app.post("/preferences")
-def save_user_preferences(preferences: PreferencesRequest):
-    save_preferences(
+async def save_user_preferences(preferences: PreferencesRequest):
+    await async_save_preferences(
         user_id=preferences.user_id,
         interests=preferences.interests,
         vibe=preferences.vibe,
@@ -218,8 +558,8 @@ def save_user_preferences(preferences: PreferencesRequest):
 # =============================================================================
 
 @app.post("/feedback")
-def submit_feedback(feedback: GiftFeedback):
-    save_feedback(
+async def submit_feedback(feedback: GiftFeedback):
+    await async_save_feedback(
         user_id=feedback.user_id,
         gift_name=feedback.gift_name,
         liked=feedback.liked,
@@ -231,9 +571,22 @@ def submit_feedback(feedback: GiftFeedback):
 # POST /recommend
 # =============================================================================
 
+# Seconds an assembled (non-streaming) /recommend response is reused for an
+# identical request
+RECOMMEND_CACHE_TTL = int(os.getenv("RECOMMEND_CACHE_TTL", "600"))
+
+# Upper bound on how much a single inferred interest/vibe weighs in a request.
+# Only orders inferred interests among themselves for retrieval's top-K cut;
+# explicit picks bypass that cut (see "explicit_interests" below)
+MAX_INFERRED_WEIGHT = 3
+
+
 @app.post("/recommend")
 async def recommend(
     body: RecommendRequest,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     stream: bool = Query(default=False),
     db: Client = Depends(get_db),
     ip_address: str = Depends(check_rate_limit_dependency),
@@ -269,15 +622,20 @@ async def recommend(
     # ------------------------------------------------------------------
     t_db = time.time()
 
-    async def _fetch_preferences():
-        return await asyncio.to_thread(get_preferences, user_id) if user_id else None
+    # Feedback/catalog versions for the fingerprint below, read before the
+    # data they version: a racing write can then only leave newer data under
+    # the older version, never older data under the newer one.
+    # feedback_version is [] for anonymous requests
+    catalog_version, *feedback_version = await async_get_namespace_versions(
+        PRODUCTS_CACHE_NAMESPACE,
+        *([feedback_version_namespace(user_id)] if user_id else []),
+    )
 
-    async def _fetch_inferred():
-        return (
-            await asyncio.to_thread(get_inferred, user_id)
-            if user_id
-            else {"interests": {}, "vibe": {}}
-        )
+    async def _fetch_user_context():
+        if not user_id:
+            return None, {"interests": {}, "vibe": {}}
+        # Explicit + inferred preferences in one Supabase RPC
+        return await async_get_user_context(user_id)
 
     async def _fetch_recipient_profile():
         if not (partner_id and user_id):
@@ -294,9 +652,8 @@ async def recommend(
             logger.error("Failed to load recipient: %s" % str(e))
             return None
 
-    explicit_raw, inferred, profile_response = await asyncio.gather(
-        _fetch_preferences(),
-        _fetch_inferred(),
+    (explicit_raw, inferred), profile_response = await asyncio.gather(
+        _fetch_user_context(),
         _fetch_recipient_profile(),
     )
     logger.info(f"[PERF] Parallel DB reads: {(time.time() - t_db)*1000:.0f}ms")
@@ -305,25 +662,24 @@ async def recommend(
 
     quiz_interests = list(body.interests or []) if confidence != "lost" else []
 
+    # Interest/vibe -> weight: quiz and saved picks count 1 each, inferred
+    # preferences contribute their learned weight capped at
+    # MAX_INFERRED_WEIGHT, so feedback that keeps incrementing one value
+    # stops changing the response fingerprint. The cap alone does not protect
+    # explicit picks (3 > 1); explicit_interests does, by exempting them from
+    # the top-K cut
+    def _capped(weights: Dict[str, int]) -> Counter:
+        return Counter({key: min(weight, MAX_INFERRED_WEIGHT) for key, weight in weights.items()})
+
     merged_preferences = {
-        "interests": list(set(
-            quiz_interests
-            + explicit["interests"]
-            + [
-                key
-                for key, weight in inferred["interests"].items()
-                for _ in range(weight)
-            ]
-        )),
-        "vibe": (
-            list(body.vibe or [])
-            + explicit["vibe"]
-            + [
-                key
-                for key, weight in inferred["vibe"].items()
-                for _ in range(weight)
-            ]
+        "interests": dict(
+            Counter(quiz_interests) + Counter(explicit["interests"]) + _capped(inferred["interests"])
+        ),
+        "vibe": dict(
+            Counter(body.vibe or []) + Counter(explicit["vibe"]) + _capped(inferred["vibe"])
         ),
+        # Never dropped by retrieval's top-K cut on inferred interests
+        "explicit_interests": list(dict.fromkeys(quiz_interests + list(explicit["interests"]))),
     }
     logger.info("Merged preferences: %s" % merged_preferences)
 
@@ -358,6 +714,39 @@ async def recommend(
             "personality": [],
         }
 
+    # ------------------------------------------------------------------
+    # CONDITIONAL REQUEST
+    # Everything that feeds retrieval and the LLM is known at this point:
+    # the request, the merged preferences, the partner, plus version counters
+    # for the user's feedback (liked/disliked gifts filter retrieval) and the
+    # catalog. A POST whose If-None-Match matches gets 412 (RFC 9110 13.1.2;
+    # 304 is only for GET/HEAD) so the client keeps the copy it holds
+    # ------------------------------------------------------------------
+    fingerprint = hash_key({
+        "request":     body.model_dump(),
+        "preferences": merged_preferences,
+        "partner":     partner_context,
+        "feedback":    feedback_version,
+        "catalog":     catalog_version,
+    })
+    etag = '"%s"' % fingerprint
+    # Assembled responses are shared across workers via Redis under the same
+    # fingerprint, so a preference, feedback or catalog change is a new key
+    # (old entries are never read again and expire after RECOMMEND_CACHE_TTL)
+    response_cache_key = f"rec:{fingerprint}"
+    if not stream:
+        if _not_modified(request, {"ETag": etag}):
+            logger.info("/recommend precondition failed (ETag %s)" % etag)
+            return Response(status_code=412, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
+        cached_response = await async_cache_get_bytes(response_cache_key)
+        if cached_response is not None:
+            logger.info(f"[PERF] Total /recommend (cached): {(time.time() - t_total)*1000:.0f}ms")
+            response.headers["X-Cache"] = "HIT"
+            return orjson.loads(cached_response)
+        response.headers["X-Cache"] = "MISS"
+
     # ------------------------------------------------------------------
     # RETRIEVE GIFTS
     # ------------------------------------------------------------------
@@ -419,8 +808,7 @@ async def recommend(
     # ------------------------------------------------------------------
     if not stream:
         t_llm = time.time()
-        llm_response, tokens_used = await asyncio.to_thread(
-            generate_gift_response,
+        llm_response, tokens_used = await generate_gift_response(
             query,
             gifts,
             merged_preferences,
@@ -429,21 +817,19 @@ async def recommend(
         )
         logger.info(f"[PERF] generate_gift_response: {(time.time() - t_llm)*1000:.0f}ms")
 
-        try:
-            record_token_usage(
-                client=db,
-                ip_address=ip_address,
-                tokens=tokens_used,
-                model="gpt-4o-mini",
-                endpoint="/recommend",
-            )
-            logger.info("Recorded %d tokens for IP: %s" % (tokens_used, ip_address))
-        except Exception as e:
-            logger.error("Failed to record token usage: %s" % str(e))
+        # Runs after the response is sent
+        background_tasks.add_task(
+            async_record_token_usage,
+            client=db,
+            ip_address=ip_address,
+            tokens=tokens_used,
+            model="gpt-4o-mini",
+            endpoint="/recommend",
+        )
 
         logger.info(f"[PERF] Total /recommend: {(time.time() - t_total)*1000:.0f}ms")
 
-        return {
+        result = {
             **llm_response,
             "occasion":           occasion,
             "relationship_stage": relationship_stage,
@@ -453,6 +839,12 @@ async def recommend(
             "results_headline":   results_headline,
             "results_subline":    results_subline,
         }
+        # Only cache real LLM output: the intro is empty when no reply (fresh
+        # or from the LLM reply cache) was parsed and every reason is an
+        # occasion fallback, which the next request should retry
+        if llm_response.get("intro"):
+            await async_cache_set_bytes(response_cache_key, orjson.dumps(result, default=str), RECOMMEND_CACHE_TTL)
+        return result
 
     # ------------------------------------------------------------------
     # STREAMING PATH — SSE (?stream=true)
@@ -480,14 +872,31 @@ async def recommend(
         yield f"data: {json.dumps({'type': 'preview', 'gifts': preview_gifts})}\n\n"
 
         t_llm = time.time()
-        llm_response, tokens_used = await asyncio.to_thread(
-            generate_gift_response,
+
+        # Forward the intro and each gift reason as the LLM produces them (a
+        # 'reset' frame means a truncated attempt is being retried: discard
+        # the intro/reasons so far); the 'result' frame below still carries
+        # the full enriched response
+        llm_events: asyncio.Queue = asyncio.Queue()
+        llm_task = asyncio.ensure_future(generate_gift_response(
             query,
             gifts,
             merged_preferences,
             partner_context,
             session_context,
-        )
+            on_event=llm_events.put_nowait,
+        ))
+        while not llm_task.done():
+            next_event = asyncio.ensure_future(llm_events.get())
+            done, _ = await asyncio.wait({next_event, llm_task}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                yield f"data: {json.dumps(next_event.result())}\n\n"
+            else:
+                next_event.cancel()
+        while not llm_events.empty():
+            yield f"data: {json.dumps(llm_events.get_nowait())}\n\n"
+
+        llm_response, tokens_used = llm_task.result()
         logger.info(
             f"[PERF] generate_gift_response (stream): "
             f"{(time.time() - t_llm)*1000:.0f}ms"
@@ -503,7 +912,7 @@ async def recommend(
         )
 
         try:
-            record_token_usage(
+            await async_record_token_usage(
                 client=db,
                 ip_address=ip_address,
                 tokens=tokens_used,
@@ -533,16 +942,26 @@ def load_vectors():
     return {"status": "Vectors loaded"}
 
 
+# The dashboard page is static; read it once instead of on every request
+try:
+    _ADMIN_HTML: Optional[bytes] = (Path(__file__).parent / "static" / "admin.html").read_bytes()
+    _ADMIN_HTML_HEADERS = {
+        "Cache-Control": "public, max-age=300",
+        "ETag": '"%s"' % hashlib.sha1(_ADMIN_HTML).hexdigest(),
+    }
+except OSError as e:
+    logger.error("Error loading admin dashboard: %s" % str(e))
+    _ADMIN_HTML = None
+    _ADMIN_HTML_HEADERS = {}
+
+
 @app.get("/admin/products", response_class=HTMLResponse)
-async def admin_dashboard():
-    try:
-        html_path = Path(__file__).parent / "static" / "admin.html"
-        with open(html_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            return HTMLResponse(content=content)
-    except Exception as e:
-        logger.error("Error loading admin dashboard: %s" % str(e))
+async def admin_dashboard(request: Request):
+    if _ADMIN_HTML is None:
         return HTMLResponse(content="Error loading admin page", status_code=500)
+    if _not_modified(request, _ADMIN_HTML_HEADERS):
+        return Response(status_code=304, headers=_ADMIN_HTML_HEADERS)
+    return HTMLResponse(content=_ADMIN_HTML, headers=_ADMIN_HTML_HEADERS)
 
 
 @app.post("/admin/generate-embeddings")
@@ -586,6 +1005,8 @@ async def generate_embeddings_for_all_gifts():
                 logger.error("Error processing gift %s: %s" % (gift.get("id", ""), str(e)))
                 error_count += 1
 
+        if success_count:
+            invalidate_product_cache()
         return {
             "status":          "complete",
             "total_processed": len(gifts),
@@ -676,6 +1097,8 @@ async def regenerate_embeddings(body: RegenerateEmbeddingsRequest = None):
                 error_count += 1
                 skipped_ids.append(gift.get("id"))
 
+        if success_count:
+            invalidate_product_cache()
         return {
             "status":          "complete",
             "mode":            mode,
@@ -0,0 +1,27 @@
+# app/openai_client.py
+# Shared OpenAI clients — one sync and one async client (each with its own
+# connection pool) for the whole process instead of one per module
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.config import OPENAI_API_KEY
+
+client = OpenAI(api_key=OPENAI_API_KEY)
+
+# HTTP/2 multiplexes concurrent requests (batch categorization, /recommend)
+# over a single TLS connection
+async_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    ),
+)
+
+
+async def close_clients() -> None:
+    """Close the shared OpenAI clients (called on app shutdown)."""
+    await async_client.close()
+    client.close()
@@ -1,16 +1,153 @@
 # app/persistence.py
 # Database operations using Supabase
 
-from app.database import get_supabase, TABLE_USER_PREFERENCES, TABLE_FEEDBACK, TABLE_INFERRED_PREFERENCES
-from typing import Optional, Dict, List
+from app.batching import BatchFlusher
+from app.database import get_supabase, get_async_supabase, TABLE_USER_PREFERENCES, TABLE_FEEDBACK, TABLE_INFERRED_PREFERENCES
+from app.cache import (
+    cache_get_json, cache_set_json, get_namespace_version, bump_namespace_version,
+    async_cache_get_json, async_cache_set_json, async_get_namespace_versions, async_bump_namespace_version,
+)
+from typing import Optional, Dict, List, Tuple
+from cachetools import TTLCache
+import asyncio
+import copy
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Per-user read caches for the /recommend hot path: a short-lived in-process
+# tier in front of a Redis tier ("pref:" / "inf:" / "fb:{user_id}:v{version}")
+# shared by all workers. Both tiers are keyed on the user's data version (see
+# feedback_version_namespace), which every write below bumps. Readers look the
+# version up first, so no worker serves data older than the last write, and a
+# read that raced a write stores its result under the version it started
+# with, which nobody reads any more. Reads run on worker threads, hence the lock.
+_MISSING = object()
+_cache_lock = threading.Lock()
+_preferences_cache = TTLCache(maxsize=10_000, ttl=60)
+_inferred_cache = TTLCache(maxsize=10_000, ttl=60)
+_feedback_cache = TTLCache(maxsize=10_000, ttl=60)
+REDIS_PREFERENCES_TTL = 300
+
+# Feedback and inferred-preference writes are buffered and written in bulk by
+# a background flusher while the app is running (see start_write_flusher).
+WRITE_FLUSH_BATCH_SIZE = int(os.getenv("PERSISTENCE_FLUSH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "0.1"))
+
+
+def feedback_version_namespace(user_id: str) -> str:
+    """Cache namespace whose version moves on every write to the user's
+    preferences, feedback or inferred weights; the read caches below and
+    cached /recommend responses are keyed on it."""
+    return f"fb:{user_id}"
+
+
+def _data_version(user_id: str) -> int:
+    return get_namespace_version(feedback_version_namespace(user_id))
+
+
+def _redis_key(prefix: str, user_id: str, version: int) -> str:
+    return f"{prefix}:{user_id}:v{version}"
+
+
+def _cached_local(cache: TTLCache, user_id: str, version: int):
+    with _cache_lock:
+        entry = cache.get(user_id)
+    if entry is None or entry[0] != version:
+        return _MISSING
+    return copy.deepcopy(entry[1])
+
+
+def _remember(cache: TTLCache, user_id: str, version: int, entry):
+    # Redis entries are stored wrapped so a cached None ("no preferences
+    # saved") is a hit
+    if not isinstance(entry, dict) or "value" not in entry:
+        return _MISSING
+    with _cache_lock:
+        cache[user_id] = (version, copy.deepcopy(entry["value"]))
+    return entry["value"]
+
+
+def _cached(cache: TTLCache, prefix: str, user_id: str, version: int):
+    value = _cached_local(cache, user_id, version)
+    if value is not _MISSING:
+        return value
+    return _remember(cache, user_id, version, cache_get_json(_redis_key(prefix, user_id, version)))
+
+
+def _store(cache: TTLCache, prefix: str, user_id: str, version: int, value) -> None:
+    with _cache_lock:
+        cache[user_id] = (version, copy.deepcopy(value))
+    cache_set_json(_redis_key(prefix, user_id, version), {"value": value}, REDIS_PREFERENCES_TTL)
+
+
+def _invalidate_local(user_id: str) -> None:
+    # Also needed when Redis is unavailable and the version never moves
+    with _cache_lock:
+        _preferences_cache.pop(user_id, None)
+        _inferred_cache.pop(user_id, None)
+        _feedback_cache.pop(user_id, None)
+
+
+def _invalidate(user_id: str) -> None:
+    # Entries under the old version are never read again and expire in Redis
+    _invalidate_local(user_id)
+    bump_namespace_version(feedback_version_namespace(user_id))
+
+
+# Event-loop counterparts of the helpers above: same caches, but the Redis
+# tier is reached through the async client
+
+async def _async_data_version(user_id: str) -> int:
+    (version,) = await async_get_namespace_versions(feedback_version_namespace(user_id))
+    return version
+
+
+async def _async_cached(cache: TTLCache, prefix: str, user_id: str, version: int):
+    value = _cached_local(cache, user_id, version)
+    if value is not _MISSING:
+        return value
+    entry = await async_cache_get_json(_redis_key(prefix, user_id, version))
+    return _remember(cache, user_id, version, entry)
+
+
+async def _async_store(cache: TTLCache, prefix: str, user_id: str, version: int, value) -> None:
+    with _cache_lock:
+        cache[user_id] = (version, copy.deepcopy(value))
+    await async_cache_set_json(_redis_key(prefix, user_id, version), {"value": value}, REDIS_PREFERENCES_TTL)
+
+
+async def _async_invalidate(user_id: str) -> None:
+    _invalidate_local(user_id)
+    await async_bump_namespace_version(feedback_version_namespace(user_id))
+
+
 # ============================================
 # User Preferences
 # ============================================
 
+def _preferences_upsert(supabase, user_id: str, interests: List[str], vibe: List[str]):
+    """Build the preferences upsert for either Supabase client; the caller
+    executes it (awaiting the result for the async client)."""
+    data = {
+        "user_id": user_id,
+        "interests": interests,
+        "vibe": vibe
+    }
+    # Insert or update in one round-trip (user_id is the primary key)
+    return supabase.table(TABLE_USER_PREFERENCES).upsert(data, on_conflict="user_id")
+
+
+def _log_preferences_saved(user_id: str, error: Optional[Exception] = None) -> bool:
+    if error is not None:
+        logger.error(f"Error saving preferences for user {user_id}: {str(error)}")
+        return False
+    logger.info(f"Saved preferences for user: {user_id}")
+    return True
+
+
 def save_preferences(user_id: str, interests: List[str], vibe: List[str]) -> bool:
     """
     Save or update user preferences.
@@ -24,39 +161,12 @@ def save_preferences(user_id: str, interests: List[str], vibe: List[str]) -> boo
         bool: True if successful, False otherwise
     """
     try:
-        supabase = get_supabase()
-
-        # Check if user preferences already exist
-        existing = supabase.table(TABLE_USER_PREFERENCES)\
-            .select("user_id")\
-            .eq("user_id", user_id)\
-            .execute()
-
-        data = {
-            "user_id": user_id,
-            "interests": interests,
-            "vibe": vibe
-        }
-
-        if existing.data:
-            # Update existing preferences
-            result = supabase.table(TABLE_USER_PREFERENCES)\
-                .update({"interests": interests, "vibe": vibe})\
-                .eq("user_id", user_id)\
-                .execute()
-            logger.info(f"Updated preferences for user: {user_id}")
-        else:
-            # Insert new preferences
-            result = supabase.table(TABLE_USER_PREFERENCES)\
-                .insert(data)\
-                .execute()
-            logger.info(f"Created preferences for user: {user_id}")
-
-        return True
-
+        _preferences_upsert(get_supabase(), user_id, interests, vibe).execute()
     except Exception as e:
-        logger.error(f"Error saving preferences for user {user_id}: {str(e)}")
-        return False
+        return _log_preferences_saved(user_id, e)
+
+    _invalidate(user_id)
+    return _log_preferences_saved(user_id)
 
 
 def get_preferences(user_id: str) -> Optional[Dict]:
@@ -69,6 +179,11 @@ def get_preferences(user_id: str) -> Optional[Dict]:
     Returns:
         Dict with 'interests' and 'vibe' keys, or None if not found
     """
+    version = _data_version(user_id)
+    cached = _cached(_preferences_cache, "pref", user_id, version)
+    if cached is not _MISSING:
+        return cached
+
     try:
         supabase = get_supabase()
 
@@ -78,13 +193,16 @@ def get_preferences(user_id: str) -> Optional[Dict]:
             .execute()
 
         if not result.data:
+            _store(_preferences_cache, "pref", user_id, version, None)
             return None
 
         pref = result.data[0]
-        return {
+        preferences = {
             "interests": pref.get("interests", []),
             "vibe": pref.get("vibe", [])
         }
+        _store(_preferences_cache, "pref", user_id, version, preferences)
+        return preferences
 
     except Exception as e:
         logger.error(f"Error getting preferences for user {user_id}: {str(e)}")
@@ -107,24 +225,42 @@ def save_feedback(user_id: str, gift_name: str, liked: bool) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
+    data = {
+        "user_id": user_id,
+        "gift_name": gift_name,
+        "liked": liked
+    }
+    if _enqueue_write("feedback", data):
+        return True
+    return save_feedback_bulk([data])
+
+
+def save_feedback_bulk(rows: List[Dict]) -> bool:
+    """
+    Insert many feedback rows in a single request.
+
+    Args:
+        rows: Dicts with 'user_id', 'gift_name' and 'liked' keys
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not rows:
+        return True
     try:
         supabase = get_supabase()
 
-        data = {
-            "user_id": user_id,
-            "gift_name": gift_name,
-            "liked": liked
-        }
-
-        result = supabase.table(TABLE_FEEDBACK)\
-            .insert(data)\
+        supabase.table(TABLE_FEEDBACK)\
+            .insert(rows)\
             .execute()
 
-        logger.info(f"Saved feedback for user {user_id}: {gift_name} - {'liked' if liked else 'disliked'}")
+        logger.info(f"Saved {len(rows)} feedback rows")
+        for user_id in {row["user_id"] for row in rows}:
+            _invalidate(user_id)
         return True
 
     except Exception as e:
-        logger.error(f"Error saving feedback for user {user_id}: {str(e)}")
+        logger.error(f"Error saving {len(rows)} feedback rows: {str(e)}")
         return False
 
 
@@ -138,6 +274,11 @@ def get_feedback(user_id: str) -> List[Dict]:
     Returns:
         List of dicts with 'gift_name' and 'liked' keys
     """
+    version = _data_version(user_id)
+    cached = _cached(_feedback_cache, "fb", user_id, version)
+    if cached is not _MISSING:
+        return cached
+
     try:
         supabase = get_supabase()
 
@@ -146,16 +287,15 @@ def get_feedback(user_id: str) -> List[Dict]:
             .eq("user_id", user_id)\
             .execute()
 
-        if not result.data:
-            return []
-
-        return [
+        feedback = [
             {
                 "gift_name": row["gift_name"],
                 "liked": row["liked"]
             }
-            for row in result.data
+            for row in result.data or []
         ]
+        _store(_feedback_cache, "fb", user_id, version, feedback)
+        return feedback
 
     except Exception as e:
         logger.error(f"Error getting feedback for user {user_id}: {str(e)}")
@@ -178,47 +318,56 @@ def update_inferred(user_id: str, category: str, value: str) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
+    if _enqueue_write("inferred", {"user_id": user_id, "category": category, "value": value}):
+        return True
+
     try:
         supabase = get_supabase()
 
-        # Check if preference already exists
-        existing = supabase.table(TABLE_INFERRED_PREFERENCES)\
-            .select("id, weight")\
-            .eq("user_id", user_id)\
-            .eq("category", category)\
-            .eq("value", value)\
-            .execute()
+        # Insert-or-increment in Postgres (see increment_inferred in
+        # supabase_schema.sql) instead of select + update/insert
+        result = supabase.rpc("increment_inferred", {
+            "uid": user_id,
+            "cat": category,
+            "val": value
+        }).execute()
 
-        if existing.data:
-            # Increment weight
-            row = existing.data[0]
-            new_weight = row["weight"] + 1
-
-            result = supabase.table(TABLE_INFERRED_PREFERENCES)\
-                .update({"weight": new_weight})\
-                .eq("id", row["id"])\
-                .execute()
-
-            logger.info(f"Incremented inferred preference for user {user_id}: {category}/{value} -> weight {new_weight}")
-        else:
-            # Create new preference
-            data = {
-                "user_id": user_id,
-                "category": category,
-                "value": value,
-                "weight": 1
-            }
+        logger.info(f"Incremented inferred preference for user {user_id}: {category}/{value} -> weight {result.data}")
+
+        _invalidate(user_id)
+        return True
+
+    except Exception as e:
+        logger.error(f"Error updating inferred preference for user {user_id}: {str(e)}")
+        return False
 
-            result = supabase.table(TABLE_INFERRED_PREFERENCES)\
-                .insert(data)\
-                .execute()
 
-            logger.info(f"Created inferred preference for user {user_id}: {category}/{value}")
+def update_inferred_bulk(rows: List[Dict]) -> bool:
+    """
+    Increment many inferred preferences in a single request.
+
+    Args:
+        rows: Dicts with 'user_id', 'category' and 'value' keys; repeated
+              entries each add 1 to the weight
 
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not rows:
+        return True
+    try:
+        supabase = get_supabase()
+
+        # See increment_inferred_bulk in supabase_schema.sql
+        supabase.rpc("increment_inferred_bulk", {"rows": rows}).execute()
+
+        logger.info(f"Incremented {len(rows)} inferred preferences")
+        for user_id in {row["user_id"] for row in rows}:
+            _invalidate(user_id)
         return True
 
     except Exception as e:
-        logger.error(f"Error updating inferred preference for user {user_id}: {str(e)}")
+        logger.error(f"Error incrementing {len(rows)} inferred preferences: {str(e)}")
         return False
 
 
@@ -232,6 +381,11 @@ def get_inferred(user_id: str) -> Dict:
     Returns:
         Dict with 'interests' and 'vibe' keys, each containing weighted preferences
     """
+    version = _data_version(user_id)
+    cached = _cached(_inferred_cache, "inf", user_id, version)
+    if cached is not _MISSING:
+        return cached
+
     try:
         supabase = get_supabase()
 
@@ -249,16 +403,156 @@ def get_inferred(user_id: str) -> Dict:
             else:  # vibe
                 vibe[row["value"]] = row["weight"]
 
-        return {
+        inferred = {
             "interests": interests,
             "vibe": vibe
         }
+        _store(_inferred_cache, "inf", user_id, version, inferred)
+        return inferred
 
     except Exception as e:
         logger.error(f"Error getting inferred preferences for user {user_id}: {str(e)}")
         return {"interests": {}, "vibe": {}}
 
 
+# ============================================
+# Combined Reads
+# ============================================
+
+def _parse_user_context(context: Optional[Dict]) -> Tuple[Optional[Dict], Dict]:
+    context = context or {}
+
+    explicit = context.get("explicit")
+    preferences = {
+        "interests": explicit.get("interests") or [],
+        "vibe": explicit.get("vibe") or []
+    } if explicit else None
+
+    weights = context.get("inferred") or {}
+    inferred = {
+        "interests": weights.get("interests") or {},
+        "vibe": weights.get("vibe") or {}
+    }
+    return preferences, inferred
+
+
+async def async_get_user_context(user_id: str) -> Tuple[Optional[Dict], Dict]:
+    """
+    Get explicit and inferred preferences in a single round-trip.
+
+    Uses the get_user_context Postgres function (see supabase_schema.sql)
+    and falls back to get_preferences() + get_inferred() if it is missing.
+
+    Args:
+        user_id: Unique user identifier
+
+    Returns:
+        Tuple of (preferences or None, inferred preferences), shaped like the
+        return values of get_preferences() and get_inferred()
+    """
+    version = await _async_data_version(user_id)
+    preferences, inferred = await asyncio.gather(
+        _async_cached(_preferences_cache, "pref", user_id, version),
+        _async_cached(_inferred_cache, "inf", user_id, version),
+    )
+    if preferences is not _MISSING and inferred is not _MISSING:
+        return preferences, inferred
+
+    try:
+        supabase = await get_async_supabase()
+
+        result = await supabase.rpc("get_user_context", {"uid": user_id}).execute()
+        preferences, inferred = _parse_user_context(result.data)
+        await asyncio.gather(
+            _async_store(_preferences_cache, "pref", user_id, version, preferences),
+            _async_store(_inferred_cache, "inf", user_id, version, inferred),
+        )
+        return preferences, inferred
+
+    except Exception as e:
+        logger.warning(f"get_user_context RPC failed for user {user_id}, using separate reads: {str(e)}")
+        preferences, inferred = await asyncio.gather(
+            asyncio.to_thread(get_preferences, user_id),
+            asyncio.to_thread(get_inferred, user_id),
+        )
+        return preferences, inferred
+
+
+# ============================================
+# Async Variants
+# ============================================
+# Same behaviour and caches as the sync functions above, but awaiting the async
+# Supabase and Redis clients so event-loop callers need no worker thread per
+# query and never block on a cache round-trip.
+# The sync versions remain for code that already runs on worker threads.
+
+async def async_save_preferences(user_id: str, interests: List[str], vibe: List[str]) -> bool:
+    """Async counterpart of save_preferences()."""
+    try:
+        supabase = await get_async_supabase()
+        await _preferences_upsert(supabase, user_id, interests, vibe).execute()
+    except Exception as e:
+        return _log_preferences_saved(user_id, e)
+
+    await _async_invalidate(user_id)
+    return _log_preferences_saved(user_id)
+
+
+async def async_save_feedback(user_id: str, gift_name: str, liked: bool) -> bool:
+    """Async counterpart of save_feedback()."""
+    data = {
+        "user_id": user_id,
+        "gift_name": gift_name,
+        "liked": liked
+    }
+    if _enqueue_write("feedback", data):
+        return True
+
+    try:
+        supabase = await get_async_supabase()
+
+        await supabase.table(TABLE_FEEDBACK)\
+            .insert(data)\
+            .execute()
+
+        logger.info(f"Saved feedback for user {user_id}: {gift_name} - {'liked' if liked else 'disliked'}")
+        await _async_invalidate(user_id)
+        return True
+
+    except Exception as e:
+        logger.error(f"Error saving feedback for user {user_id}: {str(e)}")
+        return False
+
+
+# ============================================
+# Buffered Writes
+# ============================================
+
+# Feedback and inferred-preference writes, batched while the app is running.
+# One flusher per kind: each bulk write is a single all-or-nothing statement,
+# so a failed batch can be retried without re-applying increments
+_write_flushers = {
+    "feedback": BatchFlusher(save_feedback_bulk, WRITE_FLUSH_BATCH_SIZE, WRITE_FLUSH_INTERVAL_SECONDS),
+    "inferred": BatchFlusher(update_inferred_bulk, WRITE_FLUSH_BATCH_SIZE, WRITE_FLUSH_INTERVAL_SECONDS),
+}
+
+
+def _enqueue_write(kind: str, row: Dict) -> bool:
+    """Queue a row for the flusher; False if it is not running."""
+    return _write_flushers[kind].submit(row)
+
+
+def start_write_flusher() -> None:
+    """Start buffering feedback / inferred writes (called on app startup)."""
+    for flusher in _write_flushers.values():
+        flusher.start()
+
+
+async def stop_write_flusher() -> None:
+    """Write any buffered rows and stop the flushers (called on app shutdown)."""
+    await asyncio.gather(*(flusher.stop() for flusher in _write_flushers.values()))
+
+
 # ============================================
 # Utility Functions
 # ============================================
@@ -276,12 +570,12 @@ def delete_user_data(user_id: str) -> bool:
     try:
         supabase = get_supabase()
 
-        # Delete from all tables
-        supabase.table(TABLE_USER_PREFERENCES).delete().eq("user_id", user_id).execute()
-        supabase.table(TABLE_FEEDBACK).delete().eq("user_id", user_id).execute()
-        supabase.table(TABLE_INFERRED_PREFERENCES).delete().eq("user_id", user_id).execute()
+        # Delete from all tables in one transaction (see delete_user_data in
+        # supabase_schema.sql)
+        supabase.rpc("delete_user_data", {"uid": user_id}).execute()
 
         logger.info(f"Deleted all data for user: {user_id}")
+        _invalidate(user_id)
         return True
 
     except Exception as e:
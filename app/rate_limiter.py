@@ -2,19 +2,31 @@
 # Rate limiting logic using Supabase
 
 import os
-from datetime import datetime, timedelta
-from typing import Tuple
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple
 from fastapi import Request
 from supabase import Client
 import logging
 
+from app.batching import BatchFlusher
 from app.database import get_supabase, TABLE_TOKEN_USAGE
+from app.ratelimit_redis import (
+    get_window_usage,
+    add_window_usage,
+    async_get_window_usage,
+    async_add_window_usage,
+)
 
 logger = logging.getLogger(__name__)
 
 # Configuration constants
 HOURLY_TOKEN_LIMIT = int(os.getenv("HOURLY_TOKEN_LIMIT", "50000"))
 RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW", "3600"))
+USAGE_FLUSH_BATCH_SIZE = int(os.getenv("TOKEN_USAGE_FLUSH_SIZE", "200"))
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("TOKEN_USAGE_FLUSH_INTERVAL", "2.0"))
+
 
 
 def get_client_ip(request: Request) -> str:
@@ -54,6 +66,11 @@ def record_token_usage(
     """
     Record token usage in the database.
 
+    The IP's Redis window counter (what check_rate_limit reads) is bumped
+    right away. The token_usage row itself is kept for auditing and as the
+    fallback when Redis is unavailable: while the background flusher is
+    running it is only queued, otherwise it is written immediately.
+
     Args:
         client: Supabase client instance
         ip_address: Client IP address
@@ -64,17 +81,45 @@ def record_token_usage(
     Returns:
         bool: True if successful, False otherwise
     """
+    add_window_usage(ip_address, tokens, RATE_LIMIT_WINDOW_SECONDS)
+
+    data = _usage_row(ip_address, tokens, model, endpoint)
+    if _usage_flusher.submit(data):
+        return True
+    return _insert_usage_row(client, data)
+
+
+async def async_record_token_usage(
+    client: Client,
+    ip_address: str,
+    tokens: int,
+    model: str,
+    endpoint: str
+) -> bool:
+    """Async counterpart of record_token_usage(): the Redis counter update is
+    awaited, and the direct insert (flusher not running) runs on a worker thread."""
+    await async_add_window_usage(ip_address, tokens, RATE_LIMIT_WINDOW_SECONDS)
+
+    data = _usage_row(ip_address, tokens, model, endpoint)
+    if _usage_flusher.submit(data):
+        return True
+    return await asyncio.to_thread(_insert_usage_row, client, data)
+
+
+def _usage_row(ip_address: str, tokens: int, model: str, endpoint: str) -> Dict:
+    return {
+        "ip_address": ip_address,
+        "tokens_used": tokens,
+        "model_name": model,
+        "endpoint": endpoint,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def _insert_usage_row(client: Client, data: Dict) -> bool:
     try:
-        data = {
-            "ip_address": ip_address,
-            "tokens_used": tokens,
-            "model_name": model,
-            "endpoint": endpoint,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-
-        result = client.table(TABLE_TOKEN_USAGE).insert(data).execute()
-        logger.info(f"Recorded {tokens} tokens for IP: {ip_address}")
+        client.table(TABLE_TOKEN_USAGE).insert(data).execute()
+        logger.info(f"Recorded {data['tokens_used']} tokens for IP: {data['ip_address']}")
         return True
 
     except Exception as e:
@@ -82,6 +127,30 @@ def record_token_usage(
         return False
 
 
+def _insert_usage_batch(batch: List[Dict]) -> bool:
+    try:
+        get_supabase().table(TABLE_TOKEN_USAGE).insert(batch).execute()
+        logger.info(f"Flushed {len(batch)} token usage records")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to flush {len(batch)} token usage records: {str(e)}")
+        return False
+
+
+# Buffered token_usage rows, written in bulk while the app is running
+_usage_flusher = BatchFlusher(_insert_usage_batch, USAGE_FLUSH_BATCH_SIZE, USAGE_FLUSH_INTERVAL_SECONDS)
+
+
+def start_usage_flusher() -> None:
+    """Start buffering token usage writes (called on app startup)."""
+    _usage_flusher.start()
+
+
+async def stop_usage_flusher() -> None:
+    """Flush any buffered token usage and stop the flusher (called on app shutdown)."""
+    await _usage_flusher.stop()
+
+
 def get_hourly_token_usage(client: Client, ip_address: str) -> int:
     """
     Get total token usage for an IP in the last hour.
@@ -94,22 +163,13 @@ def get_hourly_token_usage(client: Client, ip_address: str) -> int:
         Total tokens used in the last hour
     """
     try:
-        one_hour_ago = datetime.utcnow() - timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
-        one_hour_ago_iso = one_hour_ago.isoformat()
+        # Summed in Postgres — one integer comes back instead of every row
+        result = client.rpc("used_tokens_last_hour", {
+            "ip": ip_address,
+            "window_seconds": RATE_LIMIT_WINDOW_SECONDS
+        }).execute()
 
-        # Query for all token usage in the last hour
-        result = client.table(TABLE_TOKEN_USAGE)\
-            .select("tokens_used")\
-            .eq("ip_address", ip_address)\
-            .gte("timestamp", one_hour_ago_iso)\
-            .execute()
-
-        if not result.data:
-            return 0
-
-        # Sum up all tokens
-        total_tokens = sum(row["tokens_used"] for row in result.data)
-        return total_tokens
+        return int(result.data or 0)
 
     except Exception as e:
         logger.error(f"Failed to get hourly token usage: {str(e)}")
@@ -130,27 +190,44 @@ def check_rate_limit(client: Client, ip_address: str) -> Tuple[bool, int, dateti
         - tokens_used: Total tokens used in current window
         - reset_time: When the rate limit will reset
     """
-    try:
-        tokens_used = get_hourly_token_usage(client, ip_address)
-
-        # Find the oldest usage record in the current window
-        one_hour_ago = datetime.utcnow() - timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
-        one_hour_ago_iso = one_hour_ago.isoformat()
-
-        oldest_record = client.table(TABLE_TOKEN_USAGE)\
-            .select("timestamp")\
-            .eq("ip_address", ip_address)\
-            .gte("timestamp", one_hour_ago_iso)\
-            .order("timestamp", desc=False)\
-            .limit(1)\
-            .execute()
+    # One Redis GET when available; the token_usage query is the fallback
+    window = get_window_usage(ip_address, RATE_LIMIT_WINDOW_SECONDS)
+    if window is not None:
+        tokens_used, reset_time = window
+        return tokens_used < HOURLY_TOKEN_LIMIT, tokens_used, reset_time
+    return _check_rate_limit_db(client, ip_address)
+
+
+async def async_check_rate_limit(client: Client, ip_address: str) -> Tuple[bool, int, datetime]:
+    """Async counterpart of check_rate_limit(): the Redis GET is awaited and
+    the Supabase fallback runs on a worker thread."""
+    window = await async_get_window_usage(ip_address, RATE_LIMIT_WINDOW_SECONDS)
+    if window is not None:
+        tokens_used, reset_time = window
+        return tokens_used < HOURLY_TOKEN_LIMIT, tokens_used, reset_time
+    return await asyncio.to_thread(_check_rate_limit_db, client, ip_address)
 
-        # Reset time is 1 hour after the oldest record, or 1 hour from now if no records
-        if oldest_record.data:
-            oldest_timestamp = datetime.fromisoformat(oldest_record.data[0]["timestamp"].replace('Z', '+00:00'))
-            reset_time = oldest_timestamp + timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
+
+def _check_rate_limit_db(client: Client, ip_address: str) -> Tuple[bool, int, datetime]:
+    try:
+        # Window total and oldest record in one query (see rate_window in
+        # supabase_schema.sql)
+        result = client.rpc("rate_window", {
+            "ip": ip_address,
+            "window_seconds": RATE_LIMIT_WINDOW_SECONDS
+        }).execute()
+
+        row = result.data[0] if result.data else {}
+        tokens_used = int(row.get("tokens_used") or 0)
+
+        # Reset time is 1 hour after the oldest record, or 1 hour from now if
+        # no records. Window math is done on epoch seconds; the result is a
+        # naive UTC datetime like the Redis path returns.
+        if row.get("oldest"):
+            window_start = datetime.fromisoformat(row["oldest"].replace('Z', '+00:00')).timestamp()
         else:
-            reset_time = datetime.utcnow() + timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
+            window_start = time.time()
+        reset_time = datetime.utcfromtimestamp(window_start + RATE_LIMIT_WINDOW_SECONDS)
 
         is_allowed = tokens_used < HOURLY_TOKEN_LIMIT
 
@@ -159,7 +236,7 @@ def check_rate_limit(client: Client, ip_address: str) -> Tuple[bool, int, dateti
     except Exception as e:
         logger.error(f"Failed to check rate limit: {str(e)}")
         # On error, allow the request but log it
-        return True, 0, datetime.utcnow() + timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
+        return True, 0, datetime.utcfromtimestamp(time.time() + RATE_LIMIT_WINDOW_SECONDS)
 
 
 def cleanup_old_token_usage(client: Client, days: int = 7) -> int:
@@ -174,8 +251,7 @@ def cleanup_old_token_usage(client: Client, days: int = 7) -> int:
         Number of records deleted
     """
     try:
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        cutoff_iso = cutoff_date.isoformat()
+        cutoff_iso = datetime.utcfromtimestamp(time.time() - days * 86400).isoformat()
 
         result = client.table(TABLE_TOKEN_USAGE)\
             .delete()\
@@ -0,0 +1,121 @@
+# app/ratelimit_redis.py
+# Per-IP token counters in Redis for the rate limiter's hot path
+
+import time
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.cache import redis_client, async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# Counter Script
+# ============================================
+
+# INCRBY and the first EXPIRE run atomically, so a bucket can never be left
+# without a TTL (e.g. if the process dies between the two commands)
+_INCR_SCRIPT = """
+local v = redis.call('INCRBY', KEYS[1], ARGV[1])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return v
+"""
+
+_incr_script = redis_client.register_script(_INCR_SCRIPT) if redis_client is not None else None
+_async_incr_script = (
+    async_redis_client.register_script(_INCR_SCRIPT) if async_redis_client is not None else None
+)
+
+
+def _bucket(window_seconds: int) -> int:
+    return int(time.time()) // window_seconds
+
+
+def _key(ip_address: str, bucket: int) -> str:
+    return f"rl:{ip_address}:{bucket}"
+
+
+def _reset_time(bucket: int, window_seconds: int) -> datetime:
+    return datetime.utcfromtimestamp((bucket + 1) * window_seconds)
+
+
+# ============================================
+# Public API
+# ============================================
+
+def get_window_usage(ip_address: str, window_seconds: int) -> Optional[Tuple[int, datetime]]:
+    """
+    Get the tokens an IP has used in the current fixed window.
+
+    Args:
+        ip_address: Client IP address
+        window_seconds: Window length in seconds
+
+    Returns:
+        Tuple of (tokens_used, reset_time), or None if Redis is unavailable
+    """
+    if redis_client is None:
+        return None
+    bucket = _bucket(window_seconds)
+    try:
+        tokens_used = int(redis_client.get(_key(ip_address, bucket)) or 0)
+    except Exception as e:
+        logger.warning(f"Redis rate limit lookup failed for {ip_address}: {str(e)}")
+        return None
+    return tokens_used, _reset_time(bucket, window_seconds)
+
+
+def add_window_usage(ip_address: str, tokens: int, window_seconds: int) -> Optional[int]:
+    """
+    Add tokens to an IP's counter for the current fixed window.
+
+    Args:
+        ip_address: Client IP address
+        tokens: Number of tokens used
+        window_seconds: Window length in seconds (also the key's TTL)
+
+    Returns:
+        New total for the window, or None if Redis is unavailable
+    """
+    if _incr_script is None:
+        return None
+    try:
+        key = _key(ip_address, _bucket(window_seconds))
+        return int(_incr_script(keys=[key], args=[tokens, window_seconds]))
+    except Exception as e:
+        logger.warning(f"Redis rate limit update failed for {ip_address}: {str(e)}")
+        return None
+
+
+# ============================================
+# Async Variants
+# ============================================
+# Same keys and script, awaited on async_redis_client so event-loop callers
+# (the rate-limit dependency, the SSE stream) never block on Redis
+
+async def async_get_window_usage(ip_address: str, window_seconds: int) -> Optional[Tuple[int, datetime]]:
+    """Async counterpart of get_window_usage()."""
+    if async_redis_client is None:
+        return None
+    bucket = _bucket(window_seconds)
+    try:
+        tokens_used = int(await async_redis_client.get(_key(ip_address, bucket)) or 0)
+    except Exception as e:
+        logger.warning(f"Redis rate limit lookup failed for {ip_address}: {str(e)}")
+        return None
+    return tokens_used, _reset_time(bucket, window_seconds)
+
+
+async def async_add_window_usage(ip_address: str, tokens: int, window_seconds: int) -> Optional[int]:
+    """Async counterpart of add_window_usage()."""
+    if _async_incr_script is None:
+        return None
+    try:
+        key = _key(ip_address, _bucket(window_seconds))
+        return int(await _async_incr_script(keys=[key], args=[tokens, window_seconds]))
+    except Exception as e:
+        logger.warning(f"Redis rate limit update failed for {ip_address}: {str(e)}")
+        return None
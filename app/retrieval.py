@@ -1,22 +1,19 @@
-import os
+import heapq
 import logging
 import traceback
 import re
 import json
 import time
-from typing import Any, List, Dict, Optional, Set, Tuple
+from typing import Any, Collection, FrozenSet, List, Dict, Optional, Set, Tuple
 from collections import defaultdict
-from dotenv import load_dotenv
+from dataclasses import dataclass
 
 from app.embeddings import generate_embedding
 from app.persistence import get_feedback
 from app.schemas import RecommendRequest
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
-_supabase_client = None
-
 # --------------------------------------------------
 # CONFIG
 # --------------------------------------------------
@@ -53,6 +50,7 @@ SHIPPING_TIGHT_BONUS = 5
 SHIPPING_LATE_PENALTY = -20
 PRICE_FLOOR_RATIO = 0.08
 PRICE_FLOOR_MAX_BUDGET = 2000
+MAX_WEIGHTED_INTERESTS = 12
 
 MIN_VECTOR_SCORE_FOR_FULL_SCORING = 0.35
 CONFIDENT_INTEREST_MISMATCH_PENALTY = -80
@@ -238,16 +236,10 @@ def get_results_headline(occasion: str, stage: Optional[str]) -> Tuple[str, str]
 # --------------------------------------------------
 
 def get_supabase_client():
-    global _supabase_client
-    if _supabase_client is None:
-        from supabase import create_client
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_SERVICE_KEY")
-        if not url or not key:
-            raise Exception("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-        _supabase_client = create_client(url, key)
-        logger.info("Supabase client initialized (singleton)")
-    return _supabase_client
+    # Share app.database's client (and its HTTP connection pool) rather than
+    # building a second one
+    from app.database import get_supabase
+    return get_supabase()
 
 
 def tokenize(text: str) -> Set[str]:
@@ -283,12 +275,23 @@ def normalize_jsonb_to_list(value: Any) -> List[str]:
 
 
 def normalize_preferences(preferences: Optional[Dict]) -> Dict:
+    """Interests as a lowercased frozenset, built once per request so the
+    per-gift scoring only does set intersections."""
     if not preferences:
-        return {"interests": []}
+        return {"interests": frozenset()}
     interests = preferences.get("interests", [])
-    if isinstance(interests, str):
+    if isinstance(interests, dict):  # {interest: weight}
+        # Explicit picks (this request's quiz + saved preferences) are always
+        # kept; only inferred-only entries compete for the top-K slots
+        explicit = list(preferences.get("explicit_interests") or [])
+        kept = set(explicit)
+        inferred_only = sorted(
+            (i for i in interests if i not in kept), key=interests.get, reverse=True
+        )
+        interests = explicit + inferred_only[:MAX_WEIGHTED_INTERESTS]
+    elif isinstance(interests, str):
         interests = [i.strip() for i in interests.split(",")]
-    return {"interests": [str(i).lower() for i in interests if i]}
+    return {"interests": frozenset(str(i).lower().strip() for i in interests if i)}
 
 
 def compute_price_affinity_bonus(
@@ -389,18 +392,43 @@ def _gift_type_affinity_score(
 # ORIGINAL SCORING
 # --------------------------------------------------
 
+@dataclass(slots=True)
+class ScoreData:
+    """Per-gift relevance signals from compute_enhanced_score()."""
+    total_boost: float
+    intent_match_count: int
+    matched_intent: List[str]
+    already_purchased: bool
+    broad_interest_matches: Set[str]
+    missed_intent: bool
+    interest_overlap: FrozenSet[str]
+    niche_bonus: int
+
+
+def get_partner_tag_sets(partner_profile: Dict) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    return (
+        frozenset(normalize_jsonb_to_list(partner_profile.get("interests"))),
+        frozenset(normalize_jsonb_to_list(partner_profile.get("vibe"))),
+    )
+
+
 def compute_enhanced_score(
         gift: Dict,
         meaningful_intent_tokens: Set[str],
         preferences: Dict,
         user_id: Optional[str],
         partner_profile: Optional[Dict],
-        partner_gift_history: List[str],
+        partner_gift_history: Collection[str],
         confidence_level: str = "somewhat",
         weak_vector_match: bool = False,
         feedback_lookup: Optional[Dict[str, int]] = None,
         niche_keywords: Optional[List[str]] = None,
-) -> Dict:
+        partner_tag_sets: Optional[Tuple[FrozenSet[str], FrozenSet[str]]] = None,
+) -> ScoreData:
+    """
+    preferences is the output of normalize_preferences(). partner_tag_sets is
+    get_partner_tag_sets(partner_profile), passed in so a request builds it once.
+    """
     g_interests = gift.get("interests") or []
     g_categories = gift.get("gift_type") or gift.get("categories") or []
     g_vibes = gift.get("vibe") or []
@@ -416,8 +444,9 @@ def compute_enhanced_score(
     effective_intent_count = min(len(matched_intent), 1) if weak_vector_match else len(matched_intent)
     intent_score = effective_intent_count * INTENT_WEIGHT
 
-    user_interests = [i.lower().strip() for i in preferences.get("interests", []) if i]
-    interest_overlap = set(g_interests) & set(user_interests)
+    user_interests = preferences.get("interests", frozenset())
+    g_interest_set = frozenset(g_interests)
+    interest_overlap = g_interest_set & user_interests
     session_score = len(interest_overlap) * SESSION_WEIGHT
     exact_boost = 50 if interest_overlap else 0
 
@@ -432,14 +461,13 @@ def compute_enhanced_score(
 
     profile_score = 0
     if partner_profile:
-        p_interests = set(normalize_jsonb_to_list(partner_profile.get("interests")))
-        p_vibe = set(normalize_jsonb_to_list(partner_profile.get("vibe")))
+        p_interests, p_vibe = partner_tag_sets or get_partner_tag_sets(partner_profile)
         profile_score = (
-                len(set(g_interests) & p_interests) * PROFILE_WEIGHT +
-                len(set(g_vibes) & p_vibe) * (PROFILE_WEIGHT * 0.7)
+                len(g_interest_set & p_interests) * PROFILE_WEIGHT +
+                len(p_vibe.intersection(g_vibes)) * (PROFILE_WEIGHT * 0.7)
         )
 
-    history_penalty = -50 if str(gift.get("id")) in [str(id) for id in partner_gift_history] else 0
+    history_penalty = -50 if str(gift.get("id")) in partner_gift_history else 0
     feedback_score = feedback_lookup.get(gift.get("name", ""), 0) if feedback_lookup else 0
 
     intent_penalty = 0
@@ -460,16 +488,16 @@ def compute_enhanced_score(
             + history_penalty + feedback_score + intent_penalty + niche_bonus
     )
 
-    return {
-        "total_boost": total_boost,
-        "intent_match_count": len(matched_intent),
-        "matched_intent": matched_intent,
-        "already_purchased": history_penalty < 0,
-        "broad_interest_matches": broad_interest_matches,
-        "missed_intent": intent_penalty < 0,
-        "interest_overlap": interest_overlap,
-        "niche_bonus": niche_bonus,
-    }
+    return ScoreData(
+        total_boost=total_boost,
+        intent_match_count=len(matched_intent),
+        matched_intent=matched_intent,
+        already_purchased=history_penalty < 0,
+        broad_interest_matches=broad_interest_matches,
+        missed_intent=intent_penalty < 0,
+        interest_overlap=interest_overlap,
+        niche_bonus=niche_bonus,
+    )
 
 
 def compute_confidence(vector_similarity: float, intent_match_count: int) -> float:
@@ -615,7 +643,9 @@ def retrieve_gifts(
     preferences = normalize_preferences(preferences)
     partner_name = getattr(request, "partner_name", None) if request else None
     meaningful_intent_tokens = extract_meaningful_intent_tokens(query, partner_name)
-    partner_gift_history = partner_gift_history or []
+    # Stringified once for O(1) membership checks in the per-gift scoring
+    partner_gift_history = frozenset(str(gid) for gid in (partner_gift_history or []))
+    partner_tag_sets = get_partner_tag_sets(partner_profile) if partner_profile else None
 
     confidence_level = "somewhat"
     if request is not None:
@@ -626,7 +656,7 @@ def retrieve_gifts(
     if request is not None and getattr(request, "occasion", None) == "apology":
         effective_max = min(max_price or 999999, APOLOGY_PRICE_CEILING)
 
-    user_interests_set = set(preferences.get("interests", []))
+    user_interests_set = preferences["interests"]
 
     request_interests: Optional[List[str]] = None
     if request is not None and confidence_level == "confident":
@@ -701,7 +731,7 @@ def retrieve_gifts(
                 and current_price < effective_max * PRICE_FLOOR_RATIO):
             continue
 
-        gift_interests_set = set(g.get("interests") or [])
+        gift_interests_set = frozenset(g["interests"])
         unselected_niche = (NICHE_INTEREST_TAGS & gift_interests_set) - (NICHE_INTEREST_TAGS & user_interests_set)
         if unselected_niche:
             continue
@@ -725,15 +755,16 @@ def retrieve_gifts(
             weak_vector_match=weak_vector_match,
             feedback_lookup=feedback_lookup,
             niche_keywords=niche_kws,
+            partner_tag_sets=partner_tag_sets,
         )
 
-        if score_data.get("niche_bonus", 0) > 0:
+        if score_data.niche_bonus > 0:
             logger.info(
-                f"Niche bonus +{score_data['niche_bonus']} for '{g.get('display_name')}' "
+                f"Niche bonus +{score_data.niche_bonus} for '{g.get('display_name')}' "
                 f"(matched niche keyword in gift text)"
             )
 
-        novelty_score = NOVELTY_BOOST if str(g.get("id")) not in [str(gid) for gid in partner_gift_history] else 0
+        novelty_score = NOVELTY_BOOST if str(g.get("id")) not in partner_gift_history else 0
 
         try:
             price_affinity = compute_price_affinity_bonus(current_price, min_price, effective_max)
@@ -752,13 +783,13 @@ def retrieve_gifts(
                 on_time_bonus, delivery_status = SHIPPING_LATE_PENALTY, "late"
 
         has_relevance = (
-                score_data["intent_match_count"] >= 2
-                or (score_data["intent_match_count"] >= 1 and len(score_data["broad_interest_matches"]) > 0)
+                score_data.intent_match_count >= 2
+                or (score_data.intent_match_count >= 1 and len(score_data.broad_interest_matches) > 0)
         )
         gated_price_affinity = price_affinity if (has_relevance and not weak_vector_match) else 0.0
 
         original_score = (
-                vector_score + score_data["total_boost"] + novelty_score
+                vector_score + score_data.total_boost + novelty_score
                 + on_time_bonus + gated_price_affinity
         )
 
@@ -776,15 +807,15 @@ def retrieve_gifts(
         # 0.65 threshold based on rank position. Otherwise they get filtered out
         # in main.py and the user sees an empty results page.
         effective_missed_intent = (
-            False if is_fallback else score_data.get("missed_intent", False)
+            False if is_fallback else score_data.missed_intent
         )
 
-        confidence_val = compute_confidence(vec_sim, score_data["intent_match_count"])
+        confidence_val = compute_confidence(vec_sim, score_data.intent_match_count)
 
         reasons = []
-        if score_data["matched_intent"]:
-            reasons.append(f"Matches: {', '.join(score_data['matched_intent'][:2])}")
-        if score_data["broad_interest_matches"]:
+        if score_data.matched_intent:
+            reasons.append(f"Matches: {', '.join(score_data.matched_intent[:2])}")
+        if score_data.broad_interest_matches:
             reasons.append("Matches your interests")
         if delivery_status == "on_time":
             reasons.append("Fast shipping")
@@ -800,7 +831,7 @@ def retrieve_gifts(
             "confidence": round(confidence_val, 2),
             "ranking_reasons": reasons if reasons else ["Highly rated match"],
             "delivery_status": delivery_status,
-            "already_purchased": score_data.get("already_purchased", False),
+            "already_purchased": score_data.already_purchased,
             "missed_intent": effective_missed_intent,
             "fallback": is_fallback,
             "gift_type_classification": gift_type_classification,
@@ -812,11 +843,12 @@ def retrieve_gifts(
     # --------------------------------------------------
     scored = []
     niche_kws_pass1 = set(kw.lower() for kw in (request.niche_keywords or [])) if request else set()
+    request_interests_set = frozenset(request_interests or [])
 
     for g, current_price in normalised:
-        gift_interests_set = set(g.get("interests") or [])
+        gift_interests_set = frozenset(g["interests"])
         if confidence_level == "confident" and (request_interests or niche_kws_pass1):
-            has_tag_match = bool(request_interests and (gift_interests_set & set(request_interests)))
+            has_tag_match = bool(gift_interests_set & request_interests_set)
 
             # Check for niche keyword text match
             text_blob = (str(g.get("name") or "") + " " + str(g.get("description") or "")).lower()
@@ -863,7 +895,8 @@ def retrieve_gifts(
             sim_score = float(g.get("similarity") or 0)
             fallback_candidates.append((fallback_tier, sim_score, g, current_price))
 
-        fallback_candidates.sort(key=lambda x: (x[0], -x[1]))
+        # Only the best `needed` candidates are used — no need to sort them all
+        fallback_candidates = heapq.nsmallest(needed, fallback_candidates, key=lambda x: (x[0], -x[1]))
 
         added = 0
         for tier, sim_score, g, current_price in fallback_candidates:
@@ -887,8 +920,7 @@ def retrieve_gifts(
                 break
             category_counter[cat] += 1
 
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    final_results = scored[:k]
+    final_results = heapq.nlargest(k, scored, key=lambda x: x["score"])
     final_results = assign_ranked_confidence(final_results)
 
     pass1_count = sum(1 for g in final_results if not g.get("fallback"))
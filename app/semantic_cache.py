@@ -0,0 +1,147 @@
+# app/semantic_cache.py
+# In-memory nearest-neighbour cache for LLM responses keyed by embeddings
+
+import os
+import json
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Cache string values by embedding similarity.
+
+    Embeddings are L2-normalized on insert and kept in a preallocated float32
+    matrix, so a lookup is a single matrix-vector product plus argmax. When
+    full, the least recently used row is overwritten.
+
+    Values are opaque strings (callers serialize their own responses) so the
+    cache can be persisted with save()/load().
+    """
+
+    def __init__(self, threshold: float = 0.92, capacity: int = 5000, path: Optional[str] = None):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            capacity: Maximum number of entries before LRU eviction
+            path: File prefix for persistence ("{path}.npy" / "{path}.json")
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dim) float32
+        self._values: List[Optional[str]] = []
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._tick = 0
+        self._size = 0
+
+        if path:
+            self.load()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        """
+        Return the cached value of the most similar entry, if similar enough.
+
+        Args:
+            embedding: Query embedding
+
+        Returns:
+            Cached value on hit, None on miss
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            if self._size == 0 or self._matrix.shape[1] != query.shape[0]:
+                return None
+
+            sims = self._matrix[:self._size] @ query
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+
+            self._tick += 1
+            self._last_used[best] = self._tick
+            logger.info(f"Semantic cache HIT (similarity={sims[best]:.3f}, size={self._size})")
+            return self._values[best]
+
+    def insert(self, embedding: List[float], value: str) -> None:
+        """
+        Add an entry, evicting the least recently used one when full.
+
+        Args:
+            embedding: Key embedding
+            value: Serialized value to return on future hits
+        """
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            elif self._matrix.shape[1] != vec.shape[0]:
+                logger.warning("Semantic cache embedding size changed - ignoring insert")
+                return
+
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+                self._values.append(value)
+            else:
+                row = int(np.argmin(self._last_used))
+                self._values[row] = value
+
+            self._matrix[row] = vec
+            self._tick += 1
+            self._last_used[row] = self._tick
+
+    def save(self) -> None:
+        """Persist entries to "{path}.npy" and "{path}.json"."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._size == 0:
+                return
+            try:
+                np.save(f"{self.path}.npy", self._matrix[:self._size])
+                with open(f"{self.path}.json", "w") as f:
+                    json.dump(self._values[:self._size], f)
+                logger.info(f"Semantic cache saved: {self._size} entries -> {self.path}")
+            except Exception as e:
+                logger.error(f"Failed to save semantic cache: {str(e)}")
+
+    def load(self) -> None:
+        """Load entries previously written by save(), if present."""
+        if not self.path or not os.path.exists(f"{self.path}.npy"):
+            return
+        try:
+            matrix = np.load(f"{self.path}.npy")
+            with open(f"{self.path}.json") as f:
+                values = json.load(f)
+
+            size = min(len(values), matrix.shape[0], self.capacity)
+            with self._lock:
+                self._matrix = np.zeros((self.capacity, matrix.shape[1]), dtype=np.float32)
+                self._matrix[:size] = matrix[:size]
+                self._values = values[:size]
+                self._size = size
+            logger.info(f"Semantic cache loaded: {size} entries from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load semantic cache: {str(e)}")
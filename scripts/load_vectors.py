@@ -3,6 +3,9 @@ import json
 import argparse
 from pathlib import Path
 
+import numpy as np
+import orjson
+
 from app.vector_store import collection
 
 # --------------------------------------------------
@@ -34,16 +37,27 @@ def sanitize_metadata(metadata: dict) -> dict:
 # Resolve data path
 # --------------------------------------------------
 BASE_DIR = Path(__file__).resolve().parent.parent
-DATA_PATH = BASE_DIR / "data" / "gifts_embedded.json"
-
-if not DATA_PATH.exists():
-    raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
+MATRIX_PATH = BASE_DIR / "data" / "gifts_embedded.npy"
+META_PATH = BASE_DIR / "data" / "gifts_meta.json"
+LEGACY_PATH = BASE_DIR / "data" / "gifts_embedded.json"
 
 # --------------------------------------------------
 # Load embedded gifts
 # --------------------------------------------------
-with open(DATA_PATH, "r", encoding="utf-8") as f:
-    items = json.load(f)
+if MATRIX_PATH.exists() and META_PATH.exists():
+    # float32 matrix, memory-mapped (row i belongs to meta[i])
+    matrix = np.load(MATRIX_PATH, mmap_mode="r")
+    items = orjson.loads(META_PATH.read_bytes())
+    if len(items) != matrix.shape[0]:
+        raise ValueError(f"{META_PATH.name} has {len(items)} rows but {MATRIX_PATH.name} has {matrix.shape[0]}")
+    for i, item in enumerate(items):
+        item["embedding"] = matrix[i].tolist()
+elif LEGACY_PATH.exists():
+    # Older output of embed_gifts.py with inline embeddings
+    with open(LEGACY_PATH, "r", encoding="utf-8") as f:
+        items = json.load(f)
+else:
+    raise FileNotFoundError(f"Data file not found: {MATRIX_PATH} (or {LEGACY_PATH})")
 
 incoming_ids = [item["id"] for item in items]
 
@@ -34,7 +34,7 @@ CREATE TABLE IF NOT EXISTS gifts (
     in_stock BOOLEAN DEFAULT true,
 
     -- Metadata
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     created_by TEXT,
     updated_by TEXT,
@@ -61,10 +61,63 @@ CREATE INDEX IF NOT EXISTS idx_gifts_vibe ON gifts USING GIN (vibe);
 CREATE INDEX IF NOT EXISTS idx_gifts_personality_traits ON gifts USING GIN (personality_traits);
 CREATE INDEX IF NOT EXISTS idx_gifts_recipient ON gifts USING GIN (recipient);
 
--- Full-text search index
-CREATE INDEX IF NOT EXISTS idx_gifts_search ON gifts USING GIN (
-    to_tsvector('english', COALESCE(name, '') || ' ' || COALESCE(description, '') || ' ' || COALESCE(brand, ''))
-);
+-- Keyset pagination on (created_at, id) needs created_at to be set: a NULL
+-- fails both "created_at < x" and "created_at = x" and would be skipped.
+-- Backfill tables created before the column was NOT NULL, then enforce it
+UPDATE gifts SET created_at = COALESCE(updated_at, NOW()) WHERE created_at IS NULL;
+ALTER TABLE gifts ALTER COLUMN created_at SET NOT NULL;
+
+-- Admin listing: default sort (created_at DESC) with id as pagination tiebreaker
+CREATE INDEX IF NOT EXISTS idx_gifts_created_at_id ON gifts(created_at DESC, id);
+
+-- Admin listing: sort by name, with id as pagination tiebreaker
+CREATE INDEX IF NOT EXISTS idx_gifts_name_id ON gifts(name, id);
+
+-- Admin listing: partial index for the common in_stock_only=true path
+CREATE INDEX IF NOT EXISTS idx_gifts_in_stock_created_at ON gifts(created_at DESC) WHERE in_stock;
+
+-- Full-text search: one generated document over name/description/brand so
+-- admin search is a single GIN probe (replaces the old expression index and
+-- the per-column trigram indexes for ILIKE search, which only cost writes)
+DROP INDEX IF EXISTS idx_gifts_search;
+DROP INDEX IF EXISTS idx_gifts_name_trgm;
+DROP INDEX IF EXISTS idx_gifts_description_trgm;
+DROP INDEX IF EXISTS idx_gifts_brand_trgm;
+ALTER TABLE gifts ADD COLUMN IF NOT EXISTS search_doc TSVECTOR GENERATED ALWAYS AS (
+    to_tsvector('simple', COALESCE(name, '') || ' ' || COALESCE(description, '') || ' ' || COALESCE(brand, ''))
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_gifts_search_doc ON gifts USING GIN (search_doc);
+
+-- ============================================
+-- Dictionary-encoded categories
+-- ============================================
+-- Each category is stored as its 1-based position in a fixed list (2 bytes
+-- instead of a JSON string); the admin category filter and listing read this
+-- column. The list MUST stay in the same order as the Category Literal in
+-- app/admin_models.py, which decodes it via CATEGORIES_BY_ID. Append new
+-- values at the end; never reorder.
+
+CREATE OR REPLACE FUNCTION gift_vocab_ids(vals JSONB, vocab TEXT[])
+RETURNS SMALLINT[] AS $$
+    SELECT COALESCE(array_agg(array_position(vocab, v)::SMALLINT ORDER BY ord), '{}')
+    FROM jsonb_array_elements_text(COALESCE(vals, '[]'::jsonb)) WITH ORDINALITY AS t(v, ord)
+    WHERE array_position(vocab, v) IS NOT NULL;
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE gifts ADD COLUMN IF NOT EXISTS categories_ids SMALLINT[] GENERATED ALWAYS AS (
+    gift_vocab_ids(categories, ARRAY['tech', 'home', 'kitchen', 'fashion', 'beauty', 'fitness', 'outdoors', 'hobby', 'book', 'experiences'])
+) STORED;
+
+-- Default GIN array_ops (intarray's gin__int_ops only supports int4[])
+CREATE INDEX IF NOT EXISTS idx_gifts_categories_ids ON gifts USING GIN (categories_ids);
+
+-- Encoded copies of the other tag arrays were never queried; drop them (and
+-- their indexes) where an earlier version of this script created them
+ALTER TABLE gifts
+    DROP COLUMN IF EXISTS interests_ids,
+    DROP COLUMN IF EXISTS occasions_ids,
+    DROP COLUMN IF EXISTS vibe_ids,
+    DROP COLUMN IF EXISTS personality_traits_ids;
 
 -- ============================================
 -- Trigger for updated_at
@@ -97,32 +150,31 @@ CREATE POLICY "Allow backend service role" ON gifts
 -- Helper Functions
 -- ============================================
 
--- Function to get next gift ID
-CREATE OR REPLACE FUNCTION get_next_gift_id()
+-- Sequence-backed gift IDs (gift_0001, gift_0002, ...)
+-- Replaces the old get_next_gift_id() lookup, which scanned for the highest
+-- ID on every insert and could hand out duplicates under concurrent inserts.
+CREATE SEQUENCE IF NOT EXISTS gift_id_seq;
+
+-- Start the sequence after the highest existing gift_XXXX ID
+SELECT setval(
+    'gift_id_seq',
+    COALESCE((SELECT MAX(SUBSTRING(id FROM 6)::INTEGER) FROM gifts WHERE id ~ '^gift_[0-9]+$'), 0) + 1,
+    false
+);
+
+-- Zero-pad to 4 digits but never truncate (LPAD cuts longer values, so
+-- 10000 would become gift_1000 and collide). A function because the
+-- sequence value is needed twice and nextval() may only be called once.
+CREATE OR REPLACE FUNCTION next_gift_id()
 RETURNS TEXT AS $$
-DECLARE
-    last_id TEXT;
-    last_num INTEGER;
-    next_num INTEGER;
-BEGIN
-    -- Get the last gift ID
-    SELECT id INTO last_id
-    FROM gifts
-    WHERE id LIKE 'gift_%'
-    ORDER BY id DESC
-    LIMIT 1;
-
-    IF last_id IS NULL THEN
-        -- First product
-        RETURN 'gift_0001';
-    ELSE
-        -- Extract number and increment
-        last_num := CAST(SUBSTRING(last_id FROM 6) AS INTEGER);
-        next_num := last_num + 1;
-        RETURN 'gift_' || LPAD(next_num::TEXT, 4, '0');
-    END IF;
-END;
-$$ LANGUAGE plpgsql;
+    SELECT 'gift_' || CASE WHEN n < 10000 THEN LPAD(n::TEXT, 4, '0') ELSE n::TEXT END
+    FROM nextval('gift_id_seq') AS n;
+$$ LANGUAGE sql VOLATILE;
+
+ALTER TABLE gifts
+    ALTER COLUMN id SET DEFAULT next_gift_id();
+
+DROP FUNCTION IF EXISTS get_next_gift_id();
 
 -- Function to search gifts by text
 CREATE OR REPLACE FUNCTION search_gifts(search_query TEXT)
@@ -137,6 +189,27 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function to compute admin dashboard stats in a single query
+-- Returns one JSON object instead of shipping every row to the backend
+CREATE OR REPLACE FUNCTION get_gift_stats()
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_products', COUNT(*),
+        'in_stock', COUNT(*) FILTER (WHERE in_stock),
+        'out_of_stock', COUNT(*) FILTER (WHERE NOT in_stock),
+        'average_rating', COALESCE(ROUND(AVG(rating)::NUMERIC, 2), 0),
+        'category_distribution', COALESCE((
+            SELECT jsonb_object_agg(category, category_count)
+            FROM (
+                SELECT category, COUNT(*) AS category_count
+                FROM gifts, jsonb_array_elements_text(categories) AS category
+                GROUP BY category
+            ) counts
+        ), '{}'::jsonb)
+    )
+    FROM gifts;
+$$ LANGUAGE sql STABLE;
+
 -- Function to validate array limits
 CREATE OR REPLACE FUNCTION validate_gift_arrays()
 RETURNS TRIGGER AS $$
@@ -66,10 +66,19 @@ CREATE TABLE IF NOT EXISTS token_usage (
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
--- Indexes for rate limiting queries
-CREATE INDEX IF NOT EXISTS idx_token_usage_ip_address ON token_usage(ip_address);
+-- Indexes for rate limiting queries. The (ip_address, timestamp) index
+-- carries tokens_used so the window SUM/MIN is an index-only range scan, and
+-- it also serves plain ip_address lookups (no separate index needed).
 CREATE INDEX IF NOT EXISTS idx_token_usage_timestamp ON token_usage(timestamp);
-CREATE INDEX IF NOT EXISTS idx_token_usage_ip_timestamp ON token_usage(ip_address, timestamp);
+CREATE INDEX IF NOT EXISTS idx_token_usage_ip_ts_covering
+    ON token_usage(ip_address, timestamp DESC) INCLUDE (tokens_used);
+
+-- Upgrading an existing database (run each statement on its own, outside a
+-- transaction, so writes are not blocked while the index builds):
+--   CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_token_usage_ip_ts_covering
+--       ON token_usage(ip_address, timestamp DESC) INCLUDE (tokens_used);
+--   DROP INDEX CONCURRENTLY IF EXISTS idx_token_usage_ip_timestamp;
+--   DROP INDEX CONCURRENTLY IF EXISTS idx_token_usage_ip_address;
 
 -- ============================================
 -- Row Level Security (RLS) Policies
@@ -127,6 +136,99 @@ CREATE TRIGGER update_inferred_preferences_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- ============================================
+-- Rate limiting: tokens used by an IP in the current window
+-- ============================================
+-- Summed server-side (index-only scan on idx_token_usage_ip_ts_covering)
+-- so the rate limiter gets one integer back instead of every row.
+CREATE OR REPLACE FUNCTION used_tokens_last_hour(ip TEXT, window_seconds INTEGER DEFAULT 3600)
+RETURNS INTEGER AS $$
+    SELECT COALESCE(SUM(tokens_used), 0)::INTEGER
+    FROM token_usage
+    WHERE ip_address = ip
+      AND timestamp >= NOW() - make_interval(secs => window_seconds);
+$$ LANGUAGE sql STABLE;
+
+-- Tokens used plus the oldest record in the window, in one round-trip and one
+-- index scan (check_rate_limit needs both to build its reset time).
+CREATE OR REPLACE FUNCTION rate_window(ip TEXT, window_seconds INTEGER DEFAULT 3600)
+RETURNS TABLE (tokens_used INTEGER, oldest TIMESTAMP WITH TIME ZONE) AS $$
+    SELECT COALESCE(SUM(tokens_used), 0)::INTEGER, MIN(timestamp)
+    FROM token_usage
+    WHERE ip_address = ip
+      AND timestamp >= NOW() - make_interval(secs => window_seconds);
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- Inferred preferences: atomic weight increment
+-- ============================================
+-- Insert-or-increment in one statement (uses the UNIQUE constraint), so
+-- update_inferred needs one round-trip and concurrent calls never lose a bump.
+CREATE OR REPLACE FUNCTION increment_inferred(uid TEXT, cat TEXT, val TEXT)
+RETURNS INTEGER AS $$
+    INSERT INTO inferred_preferences (user_id, category, value, weight)
+    VALUES (uid, cat, val, 1)
+    ON CONFLICT (user_id, category, value)
+    DO UPDATE SET weight = inferred_preferences.weight + 1
+    RETURNING weight;
+$$ LANGUAGE sql VOLATILE;
+
+-- Batched form used by the persistence write flusher: rows is a JSON array of
+-- {user_id, category, value}; repeats within a batch add up (one row per key,
+-- since ON CONFLICT cannot touch the same row twice in one statement).
+CREATE OR REPLACE FUNCTION increment_inferred_bulk(rows JSONB)
+RETURNS void AS $$
+    INSERT INTO inferred_preferences (user_id, category, value, weight)
+    SELECT r->>'user_id', r->>'category', r->>'value', COUNT(*)::INTEGER
+    FROM jsonb_array_elements(rows) AS r
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, category, value)
+    DO UPDATE SET weight = inferred_preferences.weight + EXCLUDED.weight;
+$$ LANGUAGE sql VOLATILE;
+
+-- ============================================
+-- GDPR: delete everything stored for a user
+-- ============================================
+-- A function body runs in a single transaction, so the three deletes either
+-- all apply or none do, in one round-trip.
+CREATE OR REPLACE FUNCTION delete_user_data(uid TEXT)
+RETURNS void AS $$
+BEGIN
+    DELETE FROM user_preferences WHERE user_id = uid;
+    DELETE FROM feedback WHERE user_id = uid;
+    DELETE FROM inferred_preferences WHERE user_id = uid;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- Recommendation context: explicit + inferred preferences in one call
+-- ============================================
+-- Lets /recommend fetch both preference sources in a single PostgREST
+-- round-trip. "explicit" is NULL when the user has saved no preferences;
+-- inferred weights are folded into {value: weight} objects per category.
+CREATE OR REPLACE FUNCTION get_user_context(uid TEXT)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'explicit', (
+            SELECT jsonb_build_object('interests', interests, 'vibe', vibe)
+            FROM user_preferences
+            WHERE user_id = uid
+        ),
+        'inferred', jsonb_build_object(
+            'interests', COALESCE((
+                SELECT jsonb_object_agg(value, weight)
+                FROM inferred_preferences
+                WHERE user_id = uid AND category = 'interest'
+            ), '{}'::jsonb),
+            'vibe', COALESCE((
+                SELECT jsonb_object_agg(value, weight)
+                FROM inferred_preferences
+                WHERE user_id = uid AND category = 'vibe'
+            ), '{}'::jsonb)
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
 -- ============================================
 -- Optional: Cleanup function for old token_usage records
 -- ============================================